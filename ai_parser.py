@@ -1,16 +1,125 @@
+import asyncio
+import atexit
+import copy
+import time
 import openai
-from config import OPENAI_API_KEY
+from config import (
+    OPENAI_API_KEY, OPENAI_MAX_CONCURRENCY, OPENAI_TIMEOUT, OPENAI_DEADLINE, OPENAI_RPM,
+    OPENAI_TPM, OPENAI_MAX_RETRIES, OPENAI_MODEL, FAST_PARSE_THRESHOLD,
+    PARSE_CACHE_SIZE, PARSE_CACHE_TTL, PARSE_CACHE_FILE, STT_HEDGE_DELAY, STT_CHUNK_SECONDS,
+    TRANSCRIPT_CACHE_SIZE, TRANSCRIPT_CACHE_TTL, LLM_BATCH_SIZE, LLM_BATCH_WAIT_MS,
+    WORKER_COUNT, WORKER_INDEX
+)
 import json
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import os
 from currency_converter import currency_converter
+from fast_parser import fast_parser
+from cache import TTLCache
+from ogg_opus import split_on_silence, duration as ogg_duration
+from metrics import OPENAI_LATENCY, OPENAI_TOKENS, STT_WINS, PARSE_ROUTES, PARSE_RESULTS
+from llm_batch import MicroBatcher
+from openai_scheduler import OpenAIScheduler, PRIORITY_TEXT, PRIORITY_VOICE, estimate_tokens
 
 openai.api_key = OPENAI_API_KEY
 
+EXTRACTION_PROMPT = """Extract each income or expense in the user's message, one entry per amount.
+currency: ISO code from the text ($ → USD, € → EUR, so'm → UZS, rubl → RUB), UZS if none.
+date: YYYY-MM-DD only if the message gives one (today is {today}), otherwise null.
+description: a few words from the message. No amount → empty list."""
+
+BATCH_PROMPT = EXTRACTION_PROMPT + """
+The input is a JSON array of objects with "message", "language" and "text"; each text is
+one user's message. Return one result per message number."""
+
+TRANSACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "amount": {"type": "number"},
+        "type": {"type": "string", "enum": ["income", "expense"]},
+        "category": {"type": "string", "enum": [
+            "food", "transport", "housing", "health", "entertainment", "shopping", "education",
+            "salary", "business", "gift", "investment", "other"
+        ]},
+        "description": {"type": "string"},
+        "date": {"type": ["string", "null"]},
+        "currency": {"type": "string"},
+    },
+    "required": ["amount", "type", "category", "description", "date", "currency"],
+    "additionalProperties": False,
+}
+
+TRANSACTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {"transactions": {"type": "array", "items": TRANSACTION_SCHEMA}},
+    "required": ["transactions"],
+    "additionalProperties": False,
+}
+
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {"results": {"type": "array", "items": {
+        "type": "object",
+        "properties": {
+            "message": {"type": "integer"},
+            "transactions": TRANSACTIONS_SCHEMA["properties"]["transactions"],
+        },
+        "required": ["message", "transactions"],
+        "additionalProperties": False,
+    }}},
+    "required": ["results"],
+    "additionalProperties": False,
+}
+
+def _response_format(name: str, schema: Dict) -> Dict:
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+def _raw_transactions(transactions: List[Dict]):
+    """
+    Structured output -> the shape _build_result and the parse cache use:
+    None for no transactions, a dict for one, a list for several
+    """
+    for trans in transactions:
+        if trans.get("date") is None:
+            trans.pop("date", None)
+    if not transactions:
+        return None
+    return transactions[0] if len(transactions) == 1 else transactions
+
+class RequestSuperseded(Exception):
+    """Raised when a newer message from the same user cancels an in-flight request"""
+
+class ServiceBusy(Exception):
+    """Raised when OpenAI keeps rate-limiting a request after all retries, or misses OPENAI_DEADLINE"""
+
 class AIParser:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        # Retries are left to the scheduler, which spaces them out across all requests
+        self.client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT, max_retries=0)
+        
+        # Keep OpenAI requests within the account's rate limits and track the latest one per user;
+        # the limits are per account, so each worker process gets an equal share
+        self.scheduler = OpenAIScheduler(
+            OPENAI_MAX_CONCURRENCY, OPENAI_RPM / WORKER_COUNT, OPENAI_TPM / WORKER_COUNT, OPENAI_MAX_RETRIES
+        )
+        self.inflight: Dict[int, asyncio.Task] = {}
+        
+        # GPT output for recently seen messages, optionally kept across restarts
+        self.parse_cache = TTLCache(PARSE_CACHE_SIZE, PARSE_CACHE_TTL)
+        if PARSE_CACHE_FILE:
+            # Workers keep separate files so their saves at exit can't clobber each other
+            path = PARSE_CACHE_FILE if WORKER_COUNT == 1 else f"{PARSE_CACHE_FILE}.{WORKER_INDEX}"
+            self.parse_cache.load(path)
+            atexit.register(self.parse_cache.save, path)
+        
+        # Optionally group concurrent extraction requests into one GPT call
+        self.batcher = None
+        if LLM_BATCH_SIZE > 1:
+            self.batcher = MicroBatcher(self._request_batch, LLM_BATCH_SIZE, LLM_BATCH_WAIT_MS / 1000)
+        
+        # Transcripts by Telegram file_unique_id, so the same voice note is recognized once
+        self.transcript_cache = TTLCache(TRANSCRIPT_CACHE_SIZE, TRANSCRIPT_CACHE_TTL)
         
         # Initialize Yandex SpeechKit if credentials are available
         self.yandex_speech = None
@@ -24,148 +133,343 @@ class AIParser:
         else:
             print("⚠️  Yandex credentials not found - using Whisper for all languages")
     
-    def transcribe_audio(self, audio_file_path: str, language: str = "uz") -> str:
+    async def _run_for_user(self, user_id: Optional[int], coro):
+        """
+        Run coro as the user's only in-flight request.
+        A newer call for the same user cancels this one with RequestSuperseded.
         """
-        Transcribe audio using best service for the language
-        - Uzbek: Yandex SpeechKit (if available)
+        if user_id is None:
+            return await coro
+        
+        previous = self.inflight.get(user_id)
+        if previous and not previous.done():
+            previous.cancel()
+        
+        task = asyncio.ensure_future(coro)
+        self.inflight[user_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and self.inflight.get(user_id) is not task:
+                raise RequestSuperseded()
+            raise
+        finally:
+            if self.inflight.get(user_id) is task:
+                del self.inflight[user_id]
+    
+    async def _call_openai(self, endpoint: str, method, priority: int = PRIORITY_TEXT, **kwargs):
+        """Call an OpenAI endpoint through the rate-limit scheduler, within OPENAI_DEADLINE"""
+        tokens = estimate_tokens(kwargs) if endpoint == "chat" else 0
+        return await asyncio.wait_for(
+            self.scheduler.run(OPENAI_LATENCY.time(endpoint)(method), priority, tokens, **kwargs),
+            OPENAI_DEADLINE
+        )
+    
+    def get_cached_transcript(self, file_unique_id: str, language: str) -> Optional[str]:
+        """Transcript of a voice note recognized earlier, or None"""
+        return self.transcript_cache.get(f"{file_unique_id}|{language}")
+    
+    async def transcribe_audio(self, audio: bytes, language: str = "uz",
+                               user_id: Optional[int] = None,
+                               file_unique_id: Optional[str] = None) -> str:
+        """
+        Transcribe OGG Opus audio bytes using best service for the language
+        - Uzbek: Yandex SpeechKit uz-UZ, hedged with ru-RU and Whisper (if available)
         - Russian/English: OpenAI Whisper
+        Audio longer than STT_CHUNK_SECONDS is split on pauses and recognized in parallel.
+        The transcript is cached under file_unique_id when given.
         """
+        text = await self._run_for_user(user_id, self._transcribe(audio, language))
+        if file_unique_id:
+            self.transcript_cache.set(f"{file_unique_id}|{language}", text)
+        return text
+    
+    async def _transcribe(self, audio: bytes, language: str) -> str:
+        # Long voice notes are cut on pauses and the pieces recognized concurrently
+        segments = [audio]
+        if 0 < STT_CHUNK_SECONDS < ogg_duration(audio):
+            segments = await asyncio.to_thread(split_on_silence, audio, STT_CHUNK_SECONDS)
+        if len(segments) == 1:
+            return await self._transcribe_segment(audio, language)
         
-        # Use Yandex for Uzbek if available
+        print(f"🎤 Transcribing {len(segments)} segments in parallel")
+        tasks = [asyncio.ensure_future(self._transcribe_segment(segment, language)) for segment in segments]
+        try:
+            texts = await asyncio.gather(*tasks)
+        except BaseException:
+            # A transcript with a piece missing could be saved with the wrong amounts,
+            # so one failed segment fails the voice note
+            for task in tasks:
+                task.cancel()
+            raise
+        return " ".join(text.strip() for text in texts if text.strip())
+    
+    async def _transcribe_segment(self, audio: bytes, language: str) -> str:
+        candidates = []
         if language == "uz" and self.yandex_speech:
-            print("🎤 Using Yandex SpeechKit for Uzbek...")
-            text = self.yandex_speech.transcribe_with_fallback(audio_file_path, "uz-UZ")
-            if text:
-                return text
-            else:
-                print("⚠️  Yandex failed, falling back to Whisper...")
+            # Uzbek speakers often switch to Russian, so ru-RU is the next best guess
+            for yandex_language in ("uz-UZ", "ru-RU"):
+                candidates.append((
+                    f"yandex:{yandex_language}",
+                    lambda lang=yandex_language: self.yandex_speech.transcribe_audio(audio, lang)
+                ))
+        candidates.append(("whisper", lambda: self._whisper(audio)))
         
-        # Use Whisper for Russian, English, or as fallback
-        print("🎤 Using OpenAI Whisper...")
-        with open(audio_file_path, "rb") as audio_file:
-            transcript = self.client.audio.transcriptions.create(
+        return await self._recognize_hedged(candidates)
+    
+    async def _whisper(self, audio: bytes) -> str:
+        try:
+            transcript = await self._call_openai(
+                "whisper",
+                self.client.audio.transcriptions.create,
+                priority=PRIORITY_VOICE,
                 model="whisper-1",
-                file=audio_file
+                file=("voice.ogg", audio)
             )
-        
+        except (openai.RateLimitError, asyncio.TimeoutError) as e:
+            raise ServiceBusy() from e
         return transcript.text
-
     
-    def parse_transaction(self, text: str, language: str = "uz", user_currency: str = "UZS") -> Optional[Dict]:
-        """Extract transaction data from text using GPT - handles single or multiple transactions"""
-        prompt = f"""
-You are a financial assistant. Extract transaction information from the user's message.
-
-IMPORTANT: The user might mention MULTIPLE transactions in one message.
-
-If there is ONE transaction, return a JSON object:
-{{"amount": number, "type": "income/expense", "category": string, "description": string, "date": "YYYY-MM-DD", "currency": "USD/EUR/UZS/etc"}}
-
-If there are MULTIPLE transactions, return a JSON array:
-[
-  {{"amount": number, "type": "income/expense", "category": string, "description": string, "date": "YYYY-MM-DD", "currency": "USD/EUR/UZS/etc"}},
-  {{"amount": number, "type": "income/expense", "category": string, "description": string, "date": "YYYY-MM-DD", "currency": "USD/EUR/UZS/etc"}}
-]
-
-IMPORTANT: Extract the currency from the text (USD, EUR, $, €, etc.). If no currency mentioned, use "UZS".
-
-User message: "{text}"
-Language: {language}
-
-Common categories:
-Expense: food, transport, housing, health, entertainment, shopping, education, other
-Income: salary, business, gift, investment, other
-
-Examples:
-- "5000 for coffee" → single transaction
-- "5000 for coffee, 10000 for hotdog, 20000 for kebab" → array of 3 transactions
-- "I bought coffee for 5000 then hotdog for 10000" → array of 2 transactions
-
-If you cannot extract valid transaction data, return: {{"error": "Cannot parse transaction"}}
-"""
+    async def _recognize_hedged(self, candidates) -> str:
+        """
+        Run speech recognizers in order of preference. The next one starts after
+        STT_HEDGE_DELAY seconds, or at once if all running ones failed (0 starts all
+        together). The first non-empty transcript wins and the rest are cancelled.
+        If all fail and one was only busy, ServiceBusy is raised so the user can retry.
+        """
+        started = time.monotonic()
+        queue = list(candidates)
+        pending: Dict[asyncio.Task, str] = {}
+        last_error = None
+        busy_error = None
+        
+        def start_next():
+            name, recognize = queue.pop(0)
+            pending[asyncio.ensure_future(recognize())] = name
         
+        start_next()
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a financial data extraction assistant. Always respond with valid JSON only. Return an array if multiple transactions are mentioned."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
-            
-            result_text = response.choices[0].message.content.strip()
-            # Remove markdown code blocks if present
-            if result_text.startswith("```"):
-                result_text = result_text.split("```")[1]
-                if result_text.startswith("json"):
-                    result_text = result_text[4:]
-                result_text = result_text.strip()
-            
-            result = json.loads(result_text)
-            
-            # Check if error
-            if isinstance(result, dict) and "error" in result:
-                return None
-            
-            # Handle both single transaction (dict) and multiple transactions (list)
-            if isinstance(result, list):
-                # Multiple transactions - return as special format
-                transactions = []
-                for trans in result:
-                    if "amount" in trans and "type" in trans:
-                        # Set defaults for each transaction
-                        if "category" not in trans:
-                            trans["category"] = "other"
-                        if "description" not in trans:
-                            trans["description"] = text[:100]
-                        if "date" not in trans:
-                            trans["date"] = datetime.now().strftime("%Y-%m-%d")
-                        
-                        # Currency conversion
-                        trans_currency = trans.get("currency", "UZS")
-                        if trans_currency != user_currency:
-                            original_amount = trans["amount"]
-                            trans["amount"] = currency_converter.convert(
-                                original_amount, trans_currency, user_currency
-                            )
-                            trans["original_amount"] = original_amount
-                            trans["original_currency"] = trans_currency
-                        trans["currency"] = user_currency
-                        
-                        transactions.append(trans)
+            while pending:
+                while queue and STT_HEDGE_DELAY <= 0:
+                    start_next()
                 
-                if transactions:
-                    return {"multiple": True, "transactions": transactions}
-                else:
-                    return None
-            
-            # Single transaction
-            if "amount" not in result or "type" not in result:
-                return None
-            
-            # Set defaults
-            if "category" not in result:
-                result["category"] = "other"
-            if "description" not in result:
-                result["description"] = text[:100]
-            if "date" not in result:
-                result["date"] = datetime.now().strftime("%Y-%m-%d")
-            
-            # Currency conversion
-            trans_currency = result.get("currency", "UZS")
-            if trans_currency != user_currency:
-                original_amount = result["amount"]
-                result["amount"] = currency_converter.convert(
-                    original_amount, trans_currency, user_currency
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=STT_HEDGE_DELAY if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED
                 )
-                result["original_amount"] = original_amount
-                result["original_currency"] = trans_currency
-            result["currency"] = user_currency
-            
-            return result
+                if not done:
+                    # Preferred engine is slow - hedge with the next one
+                    start_next()
+                    continue
+                
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        text = task.result()
+                    except ServiceBusy as e:
+                        print(f"⚠️  {name} is rate-limited")
+                        busy_error = e
+                        continue
+                    except Exception as e:
+                        print(f"⚠️  {name} recognition error: {e}")
+                        last_error = e
+                        continue
+                    if text and text.strip():
+                        self._record_recognition(name, time.monotonic() - started)
+                        return text
+                    print(f"⚠️  {name} returned no text")
+                
+                if not pending and queue:
+                    start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        if busy_error:
+            raise busy_error
+        raise RuntimeError("All speech recognizers failed") from last_error
+    
+    def _record_recognition(self, engine: str, latency: float):
+        STT_WINS.observe(latency, engine)
+        print(f"🎤 {engine} transcribed in {latency:.2f}s")
+    
+    def _convert_currency(self, trans: Dict, user_currency: str) -> Dict:
+        """Convert a parsed transaction's amount into the user's currency"""
+        trans_currency = trans.get("currency", "UZS")
+        if trans_currency != user_currency:
+            original_amount = trans["amount"]
+            # Past transactions are converted at the rates of their own day
+            trans["amount"] = currency_converter.convert(
+                original_amount, trans_currency, user_currency, on_date=trans.get("date")
+            )
+            trans["original_amount"] = original_amount
+            trans["original_currency"] = trans_currency
+        trans["currency"] = user_currency
+        return trans
+    
+    async def parse_transaction(self, text: str, language: str = "uz", user_currency: str = "UZS",
+                                user_id: Optional[int] = None, priority: int = PRIORITY_TEXT) -> Optional[Dict]:
+        """
+        Extract transaction data from text using GPT - handles single or multiple transactions
+        
+        Raises:
+            ServiceBusy: if OpenAI is still rate-limiting after all retries
+        """
+        try:
+            result = await self._run_for_user(user_id, self._parse(text, language, user_currency, priority))
+        except ServiceBusy:
+            PARSE_RESULTS.inc("busy")
+            raise
+        PARSE_RESULTS.inc("success" if result else "failure")
+        return result
+    
+    async def _parse(self, text: str, language: str, user_currency: str, priority: int) -> Optional[Dict]:
+        # Simple single-amount messages are handled locally without GPT
+        result, confidence = fast_parser.parse(text)
+        if result and confidence >= FAST_PARSE_THRESHOLD:
+            PARSE_ROUTES.inc("fast")
+            return self._convert_currency(result, user_currency)
+        
+        # Repeated phrases reuse the model output; currency is converted again at current rates
+        cache_key = f"{language}|{user_currency}|{' '.join(text.lower().split())}"
+        raw = self.parse_cache.get(cache_key)
+        PARSE_ROUTES.inc("llm" if raw is None else "cache")
+        if raw is None:
+            if self.batcher:
+                raw = await self.batcher.submit((text, language, priority))
+            else:
+                raw = await self._request_transactions(text, language, priority)
+            if raw is None:
+                return None
+            raw = self._strip_today(raw)
+            # Any other date may be relative ("kecha", "вчера") and would be wrong tomorrow
+            if not self._has_dates(raw):
+                self.parse_cache.set(cache_key, raw)
+        
+        return self._build_result(copy.deepcopy(raw), text, user_currency)
+    
+    def _strip_today(self, raw):
+        """Drop dates equal to today so cached entries get the current date when reused"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        items = raw if isinstance(raw, list) else [raw]
+        for trans in items:
+            if isinstance(trans, dict) and trans.get("date") == today:
+                del trans["date"]
+        return raw
+    
+    def _has_dates(self, raw) -> bool:
+        items = raw if isinstance(raw, list) else [raw]
+        return any(isinstance(trans, dict) and trans.get("date") for trans in items)
+    
+    async def _request_transactions(self, text: str, language: str, priority: int = PRIORITY_TEXT):
+        """Ask GPT for the transactions in text; returns a dict, a list or None"""
+        try:
+            result = await self._extract(
+                "extract", f"[{language}] {text}", TRANSACTIONS_SCHEMA, priority
+            )
+            return _raw_transactions(result["transactions"]) if result else None
+        except openai.RateLimitError as e:
+            raise ServiceBusy() from e
+        except asyncio.TimeoutError as e:
+            # Usually a long queue at the rate limit, so asking again later helps
+            print(f"AI parsing timed out after {OPENAI_DEADLINE}s")
+            raise ServiceBusy() from e
         except Exception as e:
             print(f"AI parsing error: {e}")
             return None
+    
+    async def _request_batch(self, items: List[Tuple[str, str, int]]) -> list:
+        """
+        Ask GPT for the transactions in several (text, language, priority) messages with one request.
+        Returns one result (or None) per message; if the batch reply is unusable
+        every message is retried on its own.
+        """
+        if len(items) == 1:
+            return [await self._request_transactions(*items[0])]
+        
+        # JSON keeps message boundaries intact whatever a user writes
+        messages = json.dumps([
+            {"message": i, "language": language, "text": text}
+            for i, (text, language, _) in enumerate(items, 1)
+        ], ensure_ascii=False)
+        try:
+            result = await self._extract(
+                "extract_batch", messages, BATCH_SCHEMA, min(item[2] for item in items), BATCH_PROMPT
+            )
+            by_number = {entry["message"]: entry["transactions"] for entry in (result or {}).get("results", [])}
+            if not all(i in by_number for i in range(1, len(items) + 1)):
+                raise ValueError("batch reply doesn't cover every message")
+        except (openai.RateLimitError, asyncio.TimeoutError) as e:
+            # Splitting the batch would only add requests
+            raise ServiceBusy() from e
+        except Exception as e:
+            print(f"AI batch of {len(items)} failed, parsing one by one: {e}")
+            return await asyncio.gather(*(self._request_transactions(*item) for item in items))
+        
+        return [_raw_transactions(by_number[i]) for i in range(1, len(items) + 1)]
+    
+    async def _extract(self, purpose: str, content: str, schema: Dict, priority: int,
+                       prompt: str = EXTRACTION_PROMPT) -> Optional[Dict]:
+        """Schema-constrained completion; returns the decoded object, or None if the model refused"""
+        response = await self._call_openai(
+            "chat",
+            self.client.chat.completions.create,
+            priority=priority,
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": prompt.format(today=datetime.now().strftime("%Y-%m-%d"))},
+                {"role": "user", "content": content}
+            ],
+            response_format=_response_format(purpose, schema),
+            temperature=0
+        )
+        
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            OPENAI_TOKENS.inc(purpose, "prompt", amount=usage.prompt_tokens)
+            OPENAI_TOKENS.inc(purpose, "completion", amount=usage.completion_tokens)
+        
+        message = response.choices[0].message
+        if getattr(message, "refusal", None) or not message.content:
+            return None
+        return json.loads(message.content)
+    
+    def _build_result(self, result, text: str, user_currency: str) -> Optional[Dict]:
+        """Validate GPT output, fill defaults and convert to the user's currency"""
+        # Handle both single transaction (dict) and multiple transactions (list)
+        if isinstance(result, list):
+            # Multiple transactions - return as special format
+            transactions = []
+            for trans in result:
+                if "amount" in trans and "type" in trans:
+                    # Set defaults for each transaction
+                    if "category" not in trans:
+                        trans["category"] = "other"
+                    if "description" not in trans:
+                        trans["description"] = text[:100]
+                    if "date" not in trans:
+                        trans["date"] = datetime.now().strftime("%Y-%m-%d")
+                    
+                    transactions.append(self._convert_currency(trans, user_currency))
+            
+            if transactions:
+                return {"multiple": True, "transactions": transactions}
+            else:
+                return None
+        
+        # Single transaction
+        if not isinstance(result, dict) or "amount" not in result or "type" not in result:
+            return None
+        
+        # Set defaults
+        if "category" not in result:
+            result["category"] = "other"
+        if "description" not in result:
+            result["description"] = text[:100]
+        if "date" not in result:
+            result["date"] = datetime.now().strftime("%Y-%m-%d")
+        
+        return self._convert_currency(result, user_currency)
 
 ai_parser = AIParser()
@@ -0,0 +1,271 @@
+"""
+Offline micro-benchmarks for Calco AI hot paths
+Everything runs against the fakes in benchmarks/fakes.py - no Telegram,
+Supabase or OpenAI traffic.
+
+Usage:
+    python -m benchmarks.bench                  # run all, compare with baseline.json
+    python -m benchmarks.bench --save           # run all, store results as the new baseline
+    python -m benchmarks.bench -k handler       # only benchmarks whose name contains "handler"
+"""
+from benchmarks.fakes import FakePostgrest, FakeOpenAI, FakeMessage, FakeCallbackQuery, fake_voice
+
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+from database import db
+from ai_parser import ai_parser, _raw_transactions
+from fast_parser import fast_parser
+from currency_converter import currency_converter
+from translations import t
+import rendering
+import bot
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+TELEGRAM_ID = 1001
+
+BENCHMARKS: Dict[str, tuple] = {}
+
+def benchmark(name: str, iterations: int = 2000):
+    """Register a setup function that returns the operation to time"""
+    def decorator(setup: Callable) -> Callable:
+        BENCHMARKS[name] = (setup, iterations)
+        return setup
+    return decorator
+
+def fresh_backends():
+    """Point the bot at empty fakes and drop all caches"""
+    db.client = FakePostgrest()
+    db.user_cache.clear()
+    db.history_cache.clear()
+    ai_parser.client = FakeOpenAI()
+    ai_parser.parse_cache.clear()
+    ai_parser.transcript_cache.clear()
+    db.client.seed(TELEGRAM_ID)
+
+# Pure functions
+
+@benchmark("fast_parser.parse", 20000)
+def bench_fast_parser():
+    return lambda: fast_parser.parse("15 000 so'm kofe")
+
+@benchmark("ai_parser.build_result", 20000)
+def bench_build_result():
+    reply = _raw_transactions(json.loads(FakeOpenAI.DEFAULT_REPLY)["transactions"])
+    return lambda: ai_parser._build_result(json.loads(json.dumps(reply)), "coffee 5000 and hotdog 10$", "UZS")
+
+@benchmark("rendering.format_transaction_summary", 20000)
+def bench_format_summary():
+    transactions = [
+        {"amount": 1000 * i, "type": "expense", "category": "food", "description": f"item {i}"}
+        for i in range(1, 6)
+    ]
+    return lambda: rendering.format_transaction_summary(transactions, "uz", "UZS")
+
+@benchmark("translations.t", 50000)
+def bench_translate():
+    return lambda: t("transaction_added", "ru", amount=15000, category="food", description="coffee", date="2024-01-01")
+
+@benchmark("currency_converter.convert", 50000)
+def bench_convert():
+    return lambda: currency_converter.convert(100, "USD", "RUB")
+
+# AI parser with a fake OpenAI client
+
+@benchmark("ai_parser.parse_transaction[llm]")
+def bench_parse_llm():
+    fresh_backends()
+    counter = itertools.count()
+
+    async def op():
+        await ai_parser.parse_transaction(f"coffee 5000 and hotdog 10$ #{next(counter)}", "en", "UZS")
+    return op
+
+@benchmark("ai_parser.parse_transaction[cached]")
+def bench_parse_cached():
+    fresh_backends()
+
+    async def op():
+        await ai_parser.parse_transaction("coffee 5000 and hotdog 10$", "en", "UZS")
+    return op
+
+# Handlers with fake Pyrogram objects (message handlers are timed until their queued job is done)
+
+@benchmark("handler.start_command")
+def bench_start():
+    fresh_backends()
+
+    async def op():
+        await bot.start_command(None, FakeMessage(TELEGRAM_ID, "/start"))
+    return op
+
+@benchmark("handler.main_menu_callback")
+def bench_main_menu():
+    fresh_backends()
+
+    async def op():
+        await bot.main_menu_callback(None, FakeCallbackQuery(TELEGRAM_ID, "main_menu"))
+    return op
+
+@benchmark("handler.settings_callback")
+def bench_settings():
+    fresh_backends()
+
+    async def op():
+        await bot.settings_callback(None, FakeCallbackQuery(TELEGRAM_ID, "settings"))
+    return op
+
+@benchmark("handler.view_history_callback")
+def bench_history():
+    fresh_backends()
+
+    async def op():
+        await bot.view_history_callback(None, FakeCallbackQuery(TELEGRAM_ID, "view_history"))
+    return op
+
+@benchmark("handler.monthly_report_callback")
+def bench_monthly_report():
+    fresh_backends()
+
+    async def op():
+        await bot.monthly_report_callback(None, FakeCallbackQuery(TELEGRAM_ID, "monthly_report"))
+    return op
+
+@benchmark("handler.handle_text[fast]", 1000)
+def bench_handle_text_fast():
+    fresh_backends()
+
+    async def op():
+        await bot.handle_text(None, FakeMessage(TELEGRAM_ID, "15000 non"))
+        await bot.jobs.join()
+    return op
+
+@benchmark("handler.handle_text[llm]", 1000)
+def bench_handle_text_llm():
+    fresh_backends()
+    counter = itertools.count()
+
+    async def op():
+        await bot.handle_text(None, FakeMessage(TELEGRAM_ID, f"coffee 5000 and hotdog 10$ #{next(counter)}"))
+        await bot.jobs.join()
+    return op
+
+@benchmark("handler.handle_voice", 1000)
+def bench_handle_voice():
+    fresh_backends()
+    audio = b"OggS" + bytes(20000)
+    counter = itertools.count()
+
+    async def op():
+        voice = fake_voice(audio, f"AgADbench{next(counter)}")
+        await bot.handle_voice(None, FakeMessage(TELEGRAM_ID, voice=voice, voice_data=audio))
+        await bot.jobs.join()
+    return op
+
+@benchmark("handler.handle_voice[cached]", 1000)
+def bench_handle_voice_cached():
+    fresh_backends()
+    audio = b"OggS" + bytes(20000)
+
+    async def op():
+        # Same file_unique_id every time: only the first call downloads and transcribes
+        await bot.handle_voice(None, FakeMessage(TELEGRAM_ID, voice=fake_voice(audio), voice_data=audio))
+        await bot.jobs.join()
+    return op
+
+# Runner
+
+def percentile(sorted_values, pct: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def measure(op: Callable, iterations: int) -> Dict:
+    is_async = inspect.iscoroutinefunction(op)
+    warmup = max(10, iterations // 10)
+    for _ in range(warmup):
+        if is_async:
+            await op()
+        else:
+            op()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        if is_async:
+            await op()
+        else:
+            op()
+        timings.append(time.perf_counter_ns() - start)
+
+    timings.sort()
+    total_seconds = sum(timings) / 1e9
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / total_seconds, 1) if total_seconds else 0.0,
+        "p50_us": round(percentile(timings, 50) / 1000, 2),
+        "p99_us": round(percentile(timings, 99) / 1000, 2)
+    }
+
+def load_baseline() -> Dict:
+    try:
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+async def run(name_filter: str = "", scale: float = 1.0) -> Dict:
+    results = {}
+    for name, (setup, iterations) in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = await measure(setup(), max(1, int(iterations * scale)))
+    return results
+
+def report(results: Dict, baseline: Dict, tolerance: float) -> list:
+    """Print a results table; returns the names that got slower than the baseline allows"""
+    regressions = []
+    print(f"{'benchmark':<40} {'ops/sec':>12} {'p50 µs':>10} {'p99 µs':>10} {'vs base p50':>12}")
+    print("-" * 88)
+    for name, result in results.items():
+        change = ""
+        base = baseline.get(name)
+        if base and base.get("p50_us"):
+            ratio = result["p50_us"] / base["p50_us"]
+            change = f"{(ratio - 1) * 100:+.0f}%"
+            if ratio > 1 + tolerance:
+                change += " ❌"
+                regressions.append(name)
+        print(f"{name:<40} {result['ops_per_sec']:>12,.0f} {result['p50_us']:>10.2f} {result['p99_us']:>10.2f} {change:>12}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Calco AI")
+    parser.add_argument("-k", dest="name_filter", default="", help="only run benchmarks containing this text")
+    parser.add_argument("--save", action="store_true", help="store results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.name_filter, args.scale))
+    baseline = load_baseline()
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write("\n")
+        print(f"\n💾 Baseline saved to {BASELINE_PATH}")
+    elif regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) slower than baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+In-process stand-ins for Supabase (PostgREST), OpenAI and Pyrogram objects
+Lets the bot's code paths run without any network access
+"""
+import io
+import itertools
+import json
+import operator
+import os
+from datetime import date
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+# config.py refuses to import without these; benchmarks never use real credentials
+for name, value in {
+    "BOT_TOKEN": "123456:bench",
+    "API_ID": "1",
+    "API_HASH": "bench",
+    "OPENAI_API_KEY": "sk-bench",
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_KEY": "bench",
+    "RATE_SOURCE": "static",  # no exchange-rate downloads
+    "OPENAI_RPM": "0",  # the fake OpenAI has no rate limits to respect
+    "OPENAI_TPM": "0",
+}.items():
+    os.environ.setdefault(name, value)
+
+# Supabase / PostgREST
+
+class FakeResponse:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+COMPARISONS = {
+    "eq": operator.eq,
+    "neq": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda current, values: current in values,
+}
+
+class FakeQuery:
+    """Chainable query builder evaluated against in-memory rows"""
+
+    def __init__(self, store: "FakePostgrest", table: str):
+        self.store = store
+        self.table = table
+        self.action = "select"
+        self.payload = None
+        self.filters = []
+        self.ordering = []
+        self.row_limit = None
+        self.count_method = None
+
+    # Actions
+    def select(self, *columns, count=None):
+        self.action = "select"
+        self.count_method = count
+        return self
+
+    def insert(self, json, **kwargs):
+        self.action = "insert"
+        self.payload = json
+        return self
+
+    def upsert(self, json, **kwargs):
+        self.action = "insert"
+        self.payload = json
+        return self
+
+    def update(self, json, **kwargs):
+        self.action = "update"
+        self.payload = json
+        return self
+
+    def delete(self, **kwargs):
+        self.action = "delete"
+        return self
+
+    # Filters and modifiers
+    def _filter(self, op, column, value):
+        self.filters.append((op, column, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def neq(self, column, value):
+        return self._filter("neq", column, value)
+
+    def gt(self, column, value):
+        return self._filter("gt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def in_(self, column, values):
+        return self._filter("in", column, list(values))
+
+    def or_(self, filters: str, **kwargs):
+        """Supports PostgREST logic trees like "a.lt.1,and(a.eq.1,b.lt.2)" """
+        return self._filter("or", None, _parse_logic(filters))
+
+    def order(self, column, desc=False, **kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size, **kwargs):
+        self.row_limit = size
+        return self
+
+    def _matches(self, row: Dict, filters=None) -> bool:
+        for op, column, value in self.filters if filters is None else filters:
+            if op == "or":
+                if not any(self._matches(row, [branch]) for branch in value):
+                    return False
+            elif op == "and":
+                if not self._matches(row, value):
+                    return False
+            elif not COMPARISONS[op](row.get(column), value):
+                return False
+        return True
+
+    async def execute(self) -> FakeResponse:
+        rows = self.store.tables.setdefault(self.table, [])
+
+        if self.action == "insert":
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            inserted = []
+            for row in new_rows:
+                row = dict(row, id=next(self.store.ids))
+                rows.append(row)
+                inserted.append(dict(row))
+            return FakeResponse(inserted)
+
+        matched = [row for row in rows if self._matches(row)]
+
+        if self.action == "update":
+            for row in matched:
+                row.update(self.payload)
+            return FakeResponse([dict(row) for row in matched])
+
+        if self.action == "delete":
+            self.store.tables[self.table] = [row for row in rows if row not in matched]
+            return FakeResponse([dict(row) for row in matched])
+
+        for column, desc in reversed(self.ordering):
+            matched.sort(key=lambda row: row.get(column), reverse=desc)
+        count = len(matched) if self.count_method else None
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+        return FakeResponse([dict(row) for row in matched], count)
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, current = [], 0, ""
+    for char in text:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    parts.append(current)
+    return parts
+
+def _parse_logic(text: str) -> List[tuple]:
+    """Turn "a.lt.1,and(a.eq.1,b.lt.2)" into filter tuples for FakeQuery._matches"""
+    conditions = []
+    for part in _split_top_level(text):
+        if part.startswith(("and(", "or(")):
+            op, inner = part[:-1].split("(", 1)
+            conditions.append((op, None, _parse_logic(inner)))
+            continue
+        column, op, value = part.split(".", 2)
+        conditions.append((op, column, int(value) if value.lstrip("-").isdigit() else value))
+    return conditions
+
+class FakeRPC:
+    def __init__(self, store: "FakePostgrest", func: str, params: Dict):
+        self.store = store
+        self.func = func
+        self.params = params
+
+    async def execute(self) -> FakeResponse:
+        handler = getattr(self.store, f"rpc_{self.func}")
+        return FakeResponse(handler(**self.params))
+
+class FakePostgrest:
+    """Drop-in for database.db.client"""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict]] = {"users": [], "transactions": [], "loans": []}
+        self.ids = itertools.count(1)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    from_ = table
+
+    def rpc(self, func: str, params: Dict) -> FakeRPC:
+        return FakeRPC(self, func, params)
+
+    async def aclose(self):
+        pass
+
+    def rpc_monthly_summary(self, p_user_id, p_start, p_end):
+        """Python version of sql/monthly_summary.sql"""
+        rows = [
+            t for t in self.tables["transactions"]
+            if t["user_id"] == p_user_id and p_start <= t["date"] < p_end
+        ]
+        categories = {}
+        for t in rows:
+            entry = categories.setdefault((t["type"], t["category"]), {
+                "type": t["type"], "category": t["category"], "total": 0, "count": 0
+            })
+            entry["total"] += t["amount"]
+            entry["count"] += 1
+        return [{
+            "income": sum(t["amount"] for t in rows if t["type"] == "income"),
+            "expense": sum(t["amount"] for t in rows if t["type"] == "expense"),
+            "income_count": sum(1 for t in rows if t["type"] == "income"),
+            "expense_count": sum(1 for t in rows if t["type"] == "expense"),
+            "count": len(rows),
+            "categories": sorted(categories.values(), key=lambda c: c["total"], reverse=True)
+        }]
+
+    def seed(self, telegram_id: int = 1001, transactions: int = 200) -> Dict:
+        """Add a user with some history; returns the user row"""
+        user = {
+            "id": next(self.ids), "telegram_id": telegram_id, "name": "Bench",
+            "language": "uz", "currency": "UZS", "created_at": "2024-01-01T00:00:00"
+        }
+        self.tables["users"].append(user)
+        today = date.today()
+        for i in range(transactions):
+            self.tables["transactions"].append({
+                "id": next(self.ids), "user_id": user["id"], "amount": 1000 * (i % 50 + 1),
+                "type": "income" if i % 10 == 0 else "expense",
+                "category": ["food", "transport", "shopping", "salary"][i % 4],
+                "description": f"item {i}", "date": today.replace(day=1 + i % 28).isoformat()
+            })
+        return dict(user)
+
+# OpenAI
+
+class FakeCompletions:
+    def __init__(self, content: str):
+        self.content = content
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.content, refusal=None))],
+            usage=SimpleNamespace(prompt_tokens=120, completion_tokens=40, total_tokens=160)
+        )
+
+class FakeTranscriptions:
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(text=self.text)
+
+class FakeOpenAI:
+    """Drop-in for ai_parser.client (openai.AsyncOpenAI)"""
+
+    DEFAULT_REPLY = json.dumps({"transactions": [
+        {"amount": 5000, "type": "expense", "category": "food", "description": "coffee", "date": None, "currency": "UZS"},
+        {"amount": 10, "type": "expense", "category": "food", "description": "hotdog", "date": None, "currency": "USD"},
+    ]})
+
+    def __init__(self, reply: str = DEFAULT_REPLY, transcript: str = "15000 non"):
+        self.chat = SimpleNamespace(completions=FakeCompletions(reply))
+        self.audio = SimpleNamespace(transcriptions=FakeTranscriptions(transcript))
+
+# Pyrogram
+
+class FakeUser:
+    def __init__(self, user_id: int, first_name: str = "Bench"):
+        self.id = user_id
+        self.first_name = first_name
+
+def fake_voice(data: bytes, file_unique_id: str = "AgADbench"):
+    return SimpleNamespace(file_size=len(data), file_unique_id=file_unique_id, duration=3)
+
+class FakeMessage:
+    """Enough of pyrogram.types.Message for the bot's handlers"""
+
+    def __init__(self, user_id: int = 1001, text: str = "", voice=None, voice_data: bytes = b""):
+        self.from_user = FakeUser(user_id)
+        self.text = text
+        self.voice = voice
+        self.voice_data = voice_data
+        self.replies = []
+        self.edits = []
+
+    async def reply(self, text, reply_markup=None, **kwargs):
+        self.replies.append(text)
+        return FakeMessage(self.from_user.id)
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.edits.append(text)
+        return self
+
+    async def delete(self, **kwargs):
+        return True
+
+    async def download(self, file_name: str = "", in_memory: bool = False, **kwargs):
+        if not in_memory:
+            raise RuntimeError("benchmarks only support in-memory downloads")
+        buffer = io.BytesIO(self.voice_data)
+        buffer.name = "voice.ogg"
+        return buffer
+
+    def stop_propagation(self):
+        raise RuntimeError("stop_propagation called in benchmark")
+
+class FakeCallbackQuery:
+    """Enough of pyrogram.types.CallbackQuery for the bot's handlers"""
+
+    def __init__(self, user_id: int = 1001, data: str = ""):
+        self.from_user = FakeUser(user_id)
+        self.data = data
+        self.message = FakeMessage(user_id)
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False, **kwargs):
+        self.answers.append(text)
+        return True
+
+    def stop_propagation(self):
+        raise RuntimeError("stop_propagation called in benchmark")
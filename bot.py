@@ -1,101 +1,65 @@
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from config import BOT_TOKEN, API_ID, API_HASH
+from config import (
+    BOT_TOKEN, API_ID, API_HASH, SESSION_NAME, WORKER_COUNT, WORKER_INDEX, VOICE_MAX_BYTES,
+    METRICS_HOST, METRICS_PORT, JOB_WORKERS, JOB_QUEUE_SIZE, JOB_DRAIN_TIMEOUT
+)
 from database import db
-from ai_parser import ai_parser
+from ai_parser import ai_parser, RequestSuperseded, ServiceBusy
+from openai_scheduler import PRIORITY_VOICE
+from currency_converter import currency_converter
 from translations import t, TRANSLATIONS
-import os
+from rendering import (
+    CHOOSE_LANGUAGE_TEXT, get_language_keyboard, get_currency_keyboard, get_main_menu_keyboard,
+    get_loan_menu_keyboard, get_settings_keyboard, get_back_keyboard, get_loans_back_keyboard,
+    format_transaction_summary, format_history, format_loans, format_settings
+)
+from state_store import create_state_store
+from jobs import JobQueue
+from dispatch import send_heartbeats, start_handlers, stop_handlers, consume
+from metrics import track_handler, register_caches, start_server as start_metrics_server
+import asyncio
 from datetime import datetime
 
 # User states
-user_states = {}
+user_states = create_state_store()
+
+register_caches({
+    "user": db.user_cache,
+    "history": db.history_cache,
+    "parse": ai_parser.parse_cache,
+    "transcript": ai_parser.transcript_cache,
+})
+
+# Transactions per history page
+HISTORY_PAGE_SIZE = 10
+
+# Slow message processing (GPT, speech recognition, saving) runs here after the handler replies
+jobs = JobQueue(JOB_WORKERS, JOB_QUEUE_SIZE)
 
 # Initialize bot
 app = Client(
-    "calco_bot",
+    SESSION_NAME,
     api_id=API_ID,
     api_hash=API_HASH,
-    bot_token=BOT_TOKEN
+    bot_token=BOT_TOKEN,
+    # With several workers only dispatch.py's receiver takes updates from Telegram, and
+    # one handler task keeps each user's forwarded updates in order
+    no_updates=WORKER_COUNT > 1,
+    workers=1 if WORKER_COUNT > 1 else Client.WORKERS
 )
 
-def get_language_keyboard():
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("🇺🇿 O'zbek", callback_data="lang_uz"),
-            InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru")
-        ],
-        [
-            InlineKeyboardButton("🇬🇧 English", callback_data="lang_en")
-        ]
-    ])
-
-def get_currency_keyboard():
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("🇺🇿 UZS (So'm)", callback_data="currency_UZS"),
-            InlineKeyboardButton("🇺🇸 USD (Dollar)", callback_data="currency_USD")
-        ],
-        [
-            InlineKeyboardButton("🇷🇺 RUB (Ruble)", callback_data="currency_RUB")
-        ]
-    ])
-
-def format_transaction_summary(transactions: list, lang: str, user_currency: str) -> str:
-    """Format multiple transactions summary with proper language and currency"""
-    total_amount = sum(t["amount"] for t in transactions)
-    
-    # Header
-    if lang == "uz":
-        summary = f"✅ {len(transactions)} ta tranzaksiya qo'shildi!\n\n"
-    elif lang == "ru":
-        summary = f"✅ Добавлено {len(transactions)} транзакций!\n\n"
-    else:
-        summary = f"✅ Added {len(transactions)} transactions!\n\n"
-    
-    # Transaction list
-    for i, trans in enumerate(transactions, 1):
-        emoji = "💰" if trans["type"] == "income" else "💸"
-        summary += f"{i}. {emoji} {trans['amount']} {user_currency} - {trans['category']}\n"
-        summary += f"   📝 {trans['description']}\n\n"
-    
-    # Total
-    if lang == "uz":
-        summary += f"💵 Jami: {total_amount} {user_currency}"
-    elif lang == "ru":
-        summary += f"💵 Всего: {total_amount} {user_currency}"
-    else:
-        summary += f"💵 Total: {total_amount} {user_currency}"
-    
-    return summary
-
-def get_main_menu_keyboard(lang: str):
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton(t("add_expense", lang), callback_data="add_expense"),
-            InlineKeyboardButton(t("add_income", lang), callback_data="add_income")
-        ],
-        [
-            InlineKeyboardButton(t("view_history", lang), callback_data="view_history"),
-            InlineKeyboardButton(t("monthly_report", lang), callback_data="monthly_report")
-        ],
-        [
-            InlineKeyboardButton(t("manage_loans", lang), callback_data="manage_loans"),
-            InlineKeyboardButton(t("settings", lang), callback_data="settings")
-        ]
-    ])
-
-def get_loan_menu_keyboard(lang: str):
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton(t("add_loan", lang), callback_data="add_loan"),
-            InlineKeyboardButton(t("view_loans", lang), callback_data="view_loans")
-        ],
-        [InlineKeyboardButton(t("back", lang), callback_data="main_menu")]
-    ])
+async def ask_to_register(callback: CallbackQuery):
+    """Stale button pressed by someone without an account - start sign-up instead"""
+    await callback.message.edit_text(
+        TRANSLATIONS["uz"]["welcome"],
+        reply_markup=get_language_keyboard()
+    )
 
 @app.on_message(filters.command("start"))
+@track_handler
 async def start_command(client: Client, message: Message):
-    user = db.get_user(message.from_user.id)
+    user = await db.get_user(message.from_user.id)
     
     if not user:
         await message.reply(
@@ -110,22 +74,17 @@ async def start_command(client: Client, message: Message):
         )
 
 @app.on_callback_query(filters.regex("^lang_"))
+@track_handler
 async def language_callback(client: Client, callback: CallbackQuery):
     lang = callback.data.split("_")[1]
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     
     if user:
         # Existing user changing language from settings
-        db.update_user_language(callback.from_user.id, lang)
+        await db.update_user_language(callback.from_user.id, lang)
         
         # Show confirmation and go to main menu
-        lang_set_text = {
-            "uz": "✅ Til o'zbekcha o'rnatildi!",
-            "ru": "✅ Язык установлен на русский!",
-            "en": "✅ Language set to English!"
-        }
-        
-        await callback.answer(lang_set_text.get(lang, lang_set_text["en"]), show_alert=True)
+        await callback.answer(t("language_selected", lang), show_alert=True)
         
         await callback.message.edit_text(
             t("main_menu", lang),
@@ -133,26 +92,21 @@ async def language_callback(client: Client, callback: CallbackQuery):
         )
     else:
         # New user - store language and ask for currency
-        user_states[callback.from_user.id] = {"selected_language": lang}
-        
-        currency_text = {
-            "uz": "✅ Til o'zbekcha o'rnatildi!\n\n💱 Valyutani tanlang:",
-            "ru": "✅ Язык установлен на русский!\n\n💱 Выберите валюту:",
-            "en": "✅ Language set to English!\n\n💱 Choose currency:"
-        }
+        await user_states.set(callback.from_user.id, {"selected_language": lang})
         
         await callback.message.edit_text(
-            currency_text.get(lang, currency_text["en"]),
+            f"{t('language_selected', lang)}\n\n{t('choose_currency', lang)}",
             reply_markup=get_currency_keyboard()
         )
 
 @app.on_callback_query(filters.regex("^currency_"))
+@track_handler
 async def currency_callback(client: Client, callback: CallbackQuery):
     currency = callback.data.split("_")[1]
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     
     # Get language from user_states or existing user
-    state = user_states.get(callback.from_user.id, {})
+    state = await user_states.get(callback.from_user.id, {})
     lang = state.get("selected_language")
     
     if not lang and user:
@@ -164,7 +118,7 @@ async def currency_callback(client: Client, callback: CallbackQuery):
     
     if not user:
         # New user - create account
-        db.create_user(
+        await db.create_user(
             telegram_id=callback.from_user.id,
             name=callback.from_user.first_name or "User",
             language=lang,
@@ -173,20 +127,14 @@ async def currency_callback(client: Client, callback: CallbackQuery):
     else:
         # Existing user - update currency (and language if changing)
         if state.get("selected_language"):
-            db.update_user_language(callback.from_user.id, lang)
-        db.update_user_currency(callback.from_user.id, currency)
+            await db.update_user_language(callback.from_user.id, lang)
+        await db.update_user_currency(callback.from_user.id, currency)
     
     # Clear state
-    user_states.pop(callback.from_user.id, None)
+    await user_states.pop(callback.from_user.id, None)
     
     # Show confirmation message
-    currency_set_text = {
-        "uz": f"✅ Valyuta {currency} ga o'rnatildi!",
-        "ru": f"✅ Валюта установлена на {currency}!",
-        "en": f"✅ Currency set to {currency}!"
-    }
-    
-    await callback.answer(currency_set_text.get(lang, currency_set_text["en"]), show_alert=True)
+    await callback.answer(t("currency_set", lang, currency=currency), show_alert=True)
     
     await callback.message.edit_text(
         t("main_menu", lang),
@@ -194,8 +142,9 @@ async def currency_callback(client: Client, callback: CallbackQuery):
     )
 
 @app.on_callback_query(filters.regex("^main_menu$"))
+@track_handler
 async def main_menu_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     lang = user.get("language", "uz") if user else "uz"
     
     await callback.message.edit_text(
@@ -204,69 +153,102 @@ async def main_menu_callback(client: Client, callback: CallbackQuery):
     )
 
 @app.on_callback_query(filters.regex("^add_expense$|^add_income$"))
+@track_handler
 async def add_transaction_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     lang = user.get("language", "uz") if user else "uz"
     
     trans_type = "expense" if "expense" in callback.data else "income"
-    user_states[callback.from_user.id] = {"action": f"add_{trans_type}"}
+    await user_states.set(callback.from_user.id, {"action": f"add_{trans_type}"})
     
     await callback.message.edit_text(t("send_transaction", lang))
 
-@app.on_callback_query(filters.regex("^view_history$"))
+@app.on_callback_query(filters.regex("^(view_history|history_[np]_.+)$"))
+@track_handler
 async def view_history_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
-    lang = user.get("language", "uz") if user else "uz"
+    user = await db.get_user(callback.from_user.id)
+    if not user:
+        await ask_to_register(callback)
+        return
+    lang = user.get("language", "uz")
     
-    transactions = db.get_transactions(user["id"], limit=10)
+    # history_n_<date>_<id> pages to older transactions, history_p_<date>_<id> to newer ones
+    before = after = None
+    if callback.data.startswith("history_"):
+        direction, cursor = callback.data[len("history_"):].split("_", 1)
+        cursor_date, cursor_id = cursor.rsplit("_", 1)
+        if direction == "n":
+            before = (cursor_date, int(cursor_id))
+        else:
+            after = (cursor_date, int(cursor_id))
+    
+    # One extra row tells whether there is another page in that direction
+    transactions = await db.get_transactions(user["id"], limit=HISTORY_PAGE_SIZE + 1, before=before, after=after)
+    has_more = len(transactions) > HISTORY_PAGE_SIZE
+    if has_more:
+        transactions = transactions[1:] if after else transactions[:-1]
+    has_older = has_more if not after else True
+    has_newer = bool(before) or (after is not None and has_more)
     
     if not transactions:
+        if before or after:
+            # Rows around the cursor were deleted - start over from the newest
+            callback.data = "view_history"
+            await view_history_callback(client, callback)
+            return
         await callback.answer(t("history_empty", lang), show_alert=True)
         return
     
-    text = t("history_title", lang) + "\n\n"
-    buttons = []
-    
-    # Get user currency
-    user_currency = user.get("currency", "UZS")
-    
-    for i, trans in enumerate(transactions, 1):
-        emoji = "💰" if trans["type"] == "income" else "💸"
-        text += f"{i}. {emoji} {trans['amount']} {user_currency} - {trans['category']}\n"
-        text += f"   📝 {trans['description']}\n"
-        text += f"   📅 {trans['date']}\n\n"
-        
-        # Add edit/delete buttons for each transaction
-        buttons.append([
-            InlineKeyboardButton(f"{i}. {t('delete_transaction', lang)}", callback_data=f"delete_{trans['id']}")
-        ])
-    
+    title = t("history_more_title" if has_newer else "history_title", lang)
+    text = format_history(transactions, title, user.get("currency", "UZS"))
+    
+    # Add delete buttons for each transaction
+    delete_label = t("delete_transaction", lang)
+    buttons = [
+        [InlineKeyboardButton(f"{i}. {delete_label}", callback_data=f"delete_{trans['id']}")]
+        for i, trans in enumerate(transactions, 1)
+    ]
+    
+    newest, oldest = transactions[0], transactions[-1]
+    pager = []
+    if has_newer:
+        pager.append(InlineKeyboardButton(t("history_newer", lang), callback_data=f"history_p_{newest['date']}_{newest['id']}"))
+    if has_older:
+        pager.append(InlineKeyboardButton(t("history_older", lang), callback_data=f"history_n_{oldest['date']}_{oldest['id']}"))
+    if pager:
+        buttons.append(pager)
     buttons.append([InlineKeyboardButton(t("back", lang), callback_data="main_menu")])
     
     await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+    
+    if has_older:
+        db.prefetch_transactions(user["id"], HISTORY_PAGE_SIZE + 1, before=(oldest["date"], oldest["id"]))
 
 @app.on_callback_query(filters.regex("^monthly_report$"))
+@track_handler
 async def monthly_report_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
-    lang = user.get("language", "uz") if user else "uz"
+    user = await db.get_user(callback.from_user.id)
+    if not user:
+        await ask_to_register(callback)
+        return
+    lang = user.get("language", "uz")
     
     now = datetime.now()
-    summary = db.get_monthly_summary(user["id"], now.year, now.month)
+    summary = await db.get_monthly_summary(user["id"], now.year, now.month, include_transactions=False)
     
     text = t("monthly_report_text", lang,
              month=now.month,
              income=summary["income"],
              expense=summary["expense"],
              balance=summary["balance"],
-             count=len(summary["transactions"]))
+             count=summary["count"])
     
-    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup([
-        [InlineKeyboardButton(t("back", lang), callback_data="main_menu")]
-    ]))
+    await callback.message.edit_text(text, reply_markup=get_back_keyboard(lang))
 
 @app.on_callback_query(filters.regex("^manage_loans$"))
+@track_handler
 async def manage_loans_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     lang = user.get("language", "uz") if user else "uz"
     
     await callback.message.edit_text(
@@ -275,44 +257,39 @@ async def manage_loans_callback(client: Client, callback: CallbackQuery):
     )
 
 @app.on_callback_query(filters.regex("^add_loan$"))
+@track_handler
 async def add_loan_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     lang = user.get("language", "uz") if user else "uz"
     
-    user_states[callback.from_user.id] = {"action": "add_loan"}
+    await user_states.set(callback.from_user.id, {"action": "add_loan"})
     await callback.message.edit_text(t("send_loan_info", lang))
 
 @app.on_callback_query(filters.regex("^view_loans$"))
+@track_handler
 async def view_loans_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
-    lang = user.get("language", "uz") if user else "uz"
+    user = await db.get_user(callback.from_user.id)
+    if not user:
+        await ask_to_register(callback)
+        return
+    lang = user.get("language", "uz")
     
-    loans = db.get_loans(user["id"])
+    loans = await db.get_loans(user["id"])
     
     if not loans:
         await callback.answer(t("loans_empty", lang), show_alert=True)
         return
     
-    text = t("loans_list", lang)
-    for loan in loans:
-        status_emoji = "⏳" if loan["status"] == "pending" else "✅"
-        text += t("loan_item", lang,
-                  person=loan["person_name"],
-                  amount=loan["amount"],
-                  date=loan["given_date"],
-                  status=f"{status_emoji} {loan['status']}")
-    
-    await callback.message.edit_text(text, reply_markup=InlineKeyboardMarkup([
-        [InlineKeyboardButton(t("back", lang), callback_data="manage_loans")]
-    ]))
+    await callback.message.edit_text(format_loans(loans, lang), reply_markup=get_loans_back_keyboard(lang))
 
 @app.on_callback_query(filters.regex("^delete_"))
+@track_handler
 async def delete_transaction_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     lang = user.get("language", "uz") if user else "uz"
     
     transaction_id = int(callback.data.split("_")[1])
-    transaction = db.get_transaction_by_id(transaction_id)
+    transaction = await db.get_transaction_by_id(transaction_id)
     
     if not transaction:
         await callback.answer(t("transaction_not_found", lang), show_alert=True)
@@ -330,14 +307,18 @@ async def delete_transaction_callback(client: Client, callback: CallbackQuery):
     ]))
 
 @app.on_callback_query(filters.regex("^confirm_delete_"))
+@track_handler
 async def confirm_delete_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
-    lang = user.get("language", "uz") if user else "uz"
+    user = await db.get_user(callback.from_user.id)
+    if not user:
+        await ask_to_register(callback)
+        return
+    lang = user.get("language", "uz")
     
     transaction_id = int(callback.data.split("_")[2])
     
     # Delete transaction
-    success = db.delete_transaction(transaction_id, user["id"])
+    success = await db.delete_transaction(transaction_id, user["id"])
     
     if success:
         await callback.answer(t("transaction_deleted", lang), show_alert=True)
@@ -348,60 +329,40 @@ async def confirm_delete_callback(client: Client, callback: CallbackQuery):
     await view_history_callback(client, callback)
 
 @app.on_callback_query(filters.regex("^settings$"))
+@track_handler
 async def settings_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     lang = user.get("language", "uz") if user else "uz"
     currency = user.get("currency", "UZS") if user else "UZS"
     
-    settings_text = {
-        "uz": f"⚙️ Sozlamalar\n\n🌐 Joriy til: {lang.upper()}\n💱 Joriy valyuta: {currency}\n\nNimani o'zgartirmoqchisiz?",
-        "ru": f"⚙️ Настройки\n\n🌐 Текущий язык: {lang.upper()}\n💱 Текущая валюта: {currency}\n\nЧто хотите изменить?",
-        "en": f"⚙️ Settings\n\n🌐 Current language: {lang.upper()}\n💱 Current currency: {currency}\n\nWhat would you like to change?"
-    }
-    
-    button_text = {
-        "uz": ["🌐 Tilni o'zgartirish", "💱 Valyutani o'zgartirish", "🔙 Orqaga"],
-        "ru": ["🌐 Изменить язык", "💱 Изменить валюту", "🔙 Назад"],
-        "en": ["🌐 Change Language", "💱 Change Currency", "🔙 Back"]
-    }
-    
-    buttons = button_text.get(lang, button_text["en"])
-    
     await callback.message.edit_text(
-        settings_text.get(lang, settings_text["en"]),
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton(buttons[0], callback_data="change_language")],
-            [InlineKeyboardButton(buttons[1], callback_data="change_currency")],
-            [InlineKeyboardButton(buttons[2], callback_data="main_menu")]
-        ])
+        format_settings(lang, currency),
+        reply_markup=get_settings_keyboard(lang)
     )
 
 @app.on_callback_query(filters.regex("^change_language$"))
+@track_handler
 async def change_language_callback(client: Client, callback: CallbackQuery):
     await callback.message.edit_text(
-        "🌐 Tilni tanlang / Выберите язык / Choose language:",
+        CHOOSE_LANGUAGE_TEXT,
         reply_markup=get_language_keyboard()
     )
 
 @app.on_callback_query(filters.regex("^change_currency$"))
+@track_handler
 async def change_currency_callback(client: Client, callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     lang = user.get("language", "uz") if user else "uz"
     
-    currency_text = {
-        "uz": "💱 Valyutani tanlang:",
-        "ru": "💱 Выберите валюту:",
-        "en": "💱 Choose currency:"
-    }
-    
     await callback.message.edit_text(
-        currency_text.get(lang, currency_text["en"]),
+        t("choose_currency", lang),
         reply_markup=get_currency_keyboard()
     )
 
 @app.on_message(filters.text & filters.private)
+@track_handler
 async def handle_text(client: Client, message: Message):
-    user = db.get_user(message.from_user.id)
+    user = await db.get_user(message.from_user.id)
     
     if not user:
         await message.reply(
@@ -410,83 +371,106 @@ async def handle_text(client: Client, message: Message):
         )
         return
     
+    # Answer at once; the job fills in this message when the transaction is saved
+    lang = user.get("language", "uz")
+    placeholder = await message.reply(t("processing", lang))
+    await jobs.submit(
+        "process_text", process_text, message, placeholder, user,
+        key=message.from_user.id, on_drop=lambda: placeholder.edit_text(t("transaction_error", lang))
+    )
+
+async def process_text(message: Message, placeholder: Message, user: dict):
+    lang = user.get("language", "uz")
+    try:
+        await save_text(message, placeholder, user)
+    except Exception:
+        await placeholder.edit_text(t("transaction_error", lang))
+        raise
+
+async def save_text(message: Message, placeholder: Message, user: dict):
     lang = user.get("language", "uz")
     user_id = message.from_user.id
-    state = user_states.get(user_id, {})
+    state = await user_states.get(user_id, {})
     
     if state.get("action") == "add_loan":
         user_currency = user.get("currency", "UZS")
-        result = ai_parser.parse_transaction(message.text, lang, user_currency)
+        try:
+            result = await ai_parser.parse_transaction(message.text, lang, user_currency, user_id=user_id)
+        except RequestSuperseded:
+            await placeholder.edit_text(t("request_superseded", lang))
+            return
+        except ServiceBusy:
+            await placeholder.edit_text(t("service_busy", lang))
+            return
         
         if result and "amount" in result:
             person_name = result.get("description", "Unknown").split()[0] if result.get("description") else "Unknown"
             
-            loan = db.add_loan(
+            loan = await db.add_loan(
                 user_id=user["id"],
                 person_name=person_name,
                 amount=result["amount"]
             )
             
-            await message.reply(
+            await placeholder.edit_text(
                 t("loan_added", lang,
                   person=person_name,
                   amount=result["amount"],
                   date=loan["given_date"]),
                 reply_markup=get_main_menu_keyboard(lang)
             )
-            user_states.pop(user_id, None)
+            await user_states.pop(user_id, None)
         else:
-            await message.reply(t("parse_error", lang))
+            await placeholder.edit_text(t("parse_error", lang))
     else:
         user_currency = user.get("currency", "UZS")
-        result = ai_parser.parse_transaction(message.text, lang, user_currency)
+        try:
+            result = await ai_parser.parse_transaction(message.text, lang, user_currency, user_id=user_id)
+        except RequestSuperseded:
+            await placeholder.edit_text(t("request_superseded", lang))
+            return
+        except ServiceBusy:
+            await placeholder.edit_text(t("service_busy", lang))
+            return
         
         if result:
-            # Check if multiple transactions
-            if result.get("multiple"):
-                # Handle multiple transactions
-                transactions = result["transactions"]
-                total_amount = sum(t["amount"] for t in transactions)
-                
-                # Save all transactions
-                for trans in transactions:
-                    db.add_transaction(
-                        user_id=user["id"],
-                        amount=trans["amount"],
-                        trans_type=trans["type"],
-                        category=trans["category"],
-                        description=trans["description"]
-                    )
-                
-                # Send summary message
-                summary = format_transaction_summary(transactions, lang, user_currency)
-                await message.reply(summary, reply_markup=get_main_menu_keyboard(lang))
-                user_states.pop(user_id, None)
-            else:
-                # Single transaction
-                transaction = db.add_transaction(
-                    user_id=user["id"],
-                    amount=result["amount"],
-                    trans_type=result["type"],
-                    category=result["category"],
-                    description=result["description"]
-                )
-                
-                await message.reply(
-                    t("transaction_added", lang,
-                      amount=result["amount"],
-                      category=result["category"],
-                      description=result["description"],
-                      date=transaction["date"]),
-                    reply_markup=get_main_menu_keyboard(lang)
-                )
-                user_states.pop(user_id, None)
+            await placeholder.edit_text(
+                await save_transactions(user, result, lang, user_currency),
+                reply_markup=get_main_menu_keyboard(lang)
+            )
+            await user_states.pop(user_id, None)
         else:
-            await message.reply(t("parse_error", lang))
+            await placeholder.edit_text(t("parse_error", lang))
+
+async def save_transactions(user: dict, result: dict, lang: str, user_currency: str) -> str:
+    """Store parsed transactions and return the confirmation text"""
+    # Check if multiple transactions
+    if result.get("multiple"):
+        # Save all transactions in one request
+        transactions = result["transactions"]
+        await db.add_transactions(user["id"], transactions)
+        return format_transaction_summary(transactions, lang, user_currency)
+    
+    # Single transaction
+    transaction = await db.add_transaction(
+        user_id=user["id"],
+        amount=result["amount"],
+        trans_type=result["type"],
+        category=result["category"],
+        description=result["description"],
+        # Amounts were converted at this date's rates, so store it too
+        trans_date=result.get("date")
+    )
+    return t("transaction_added", lang,
+             amount=result["amount"],
+             category=result["category"],
+             description=result["description"],
+             date=transaction["date"])
 
 @app.on_message(filters.voice & filters.private)
+@track_handler
 async def handle_voice(client: Client, message: Message):
-    user = db.get_user(message.from_user.id)
+    user = await db.get_user(message.from_user.id)
     
     if not user:
         await message.reply(
@@ -496,72 +480,102 @@ async def handle_voice(client: Client, message: Message):
         return
     
     lang = user.get("language", "uz")
-    status_msg = await message.reply(t("voice_processing", lang))
+    
+    # Refuse oversized voice notes before downloading anything
+    if message.voice.file_size and message.voice.file_size > VOICE_MAX_BYTES:
+        await message.reply(t("voice_too_large", lang))
+        return
+    
+    placeholder = await message.reply(t("voice_processing", lang))
+    await jobs.submit(
+        "process_voice", process_voice, message, placeholder, user,
+        key=message.from_user.id, on_drop=lambda: placeholder.edit_text(t("transaction_error", lang))
+    )
+
+async def process_voice(message: Message, placeholder: Message, user: dict):
+    lang = user.get("language", "uz")
     
     try:
-        voice_file = await message.download()
-        text = ai_parser.transcribe_audio(voice_file, lang)
-        os.remove(voice_file)
-        
-        # Delete processing message (don't show transcribed text to user)
-        await status_msg.delete()
+        # Forwarded or retried voice notes were already transcribed - skip download and STT
+        file_unique_id = message.voice.file_unique_id
+        text = ai_parser.get_cached_transcript(file_unique_id, lang)
+        if text is None:
+            # Download straight into memory - no temp file to read back or clean up
+            voice_buffer = await message.download(in_memory=True)
+            text = await ai_parser.transcribe_audio(
+                voice_buffer.getvalue(), lang,
+                user_id=message.from_user.id, file_unique_id=file_unique_id
+            )
         
         user_currency = user.get("currency", "UZS")
-        result = ai_parser.parse_transaction(text, lang, user_currency)
+        result = await ai_parser.parse_transaction(
+            text, lang, user_currency, user_id=message.from_user.id, priority=PRIORITY_VOICE
+        )
         
+        # The transcribed text itself is never shown to the user
         if result:
-            # Check if multiple transactions
-            if result.get("multiple"):
-                # Handle multiple transactions
-                transactions = result["transactions"]
-                total_amount = sum(t["amount"] for t in transactions)
-                
-                # Save all transactions
-                for trans in transactions:
-                    db.add_transaction(
-                        user_id=user["id"],
-                        amount=trans["amount"],
-                        trans_type=trans["type"],
-                        category=trans["category"],
-                        description=trans["description"]
-                    )
-                
-                # Send summary message
-                summary = f"✅ {len(transactions)} ta tranzaksiya qo'shildi!\n\n" if lang == "uz" else f"✅ Добавлено {len(transactions)} транзакций!\n\n"
-                
-                for i, trans in enumerate(transactions, 1):
-                    emoji = "💰" if trans["type"] == "income" else "💸"
-                    summary += f"{i}. {emoji} {trans['amount']} so'm - {trans['category']}\n"
-                    summary += f"   📝 {trans['description']}\n\n"
-                
-                summary += f"💵 Jami: {total_amount} so'm" if lang == "uz" else f"💵 Всего: {total_amount} сум"
-                
-                await message.reply(summary, reply_markup=get_main_menu_keyboard(lang))
-            else:
-                # Single transaction
-                transaction = db.add_transaction(
-                    user_id=user["id"],
-                    amount=result["amount"],
-                    trans_type=result["type"],
-                    category=result["category"],
-                    description=result["description"]
-                )
-                
-                await message.reply(
-                    t("transaction_added", lang,
-                      amount=result["amount"],
-                      category=result["category"],
-                      description=result["description"],
-                      date=transaction["date"]),
-                    reply_markup=get_main_menu_keyboard(lang)
-                )
+            await placeholder.edit_text(
+                await save_transactions(user, result, lang, user_currency),
+                reply_markup=get_main_menu_keyboard(lang)
+            )
         else:
-            await message.reply(t("parse_error", lang))
+            await placeholder.edit_text(t("parse_error", lang))
+    
+    except RequestSuperseded:
+        await placeholder.edit_text(t("request_superseded", lang))
+    
+    except ServiceBusy:
+        await placeholder.edit_text(t("service_busy", lang))
     
     except Exception as e:
         print(f"Voice processing error: {e}")
-        await status_msg.edit_text(t("transaction_error", lang))
+        await placeholder.edit_text(t("transaction_error", lang))
+
+async def serve(heartbeat=None, updates=None):
+    """
+    Run the bot until stopped; heartbeat and updates (this worker's queue of
+    forwarded updates) are set by supervisor.py
+    """
+    async with app:
+        consume_task = None
+        stopping = asyncio.Event()
+        if updates is not None:
+            await start_handlers(app)
+            consume_task = asyncio.create_task(consume(app, updates, stopping))
+        # Keep a reference so the task isn't garbage collected
+        heartbeat_task = asyncio.create_task(send_heartbeats(heartbeat)) if heartbeat is not None else None
+        rates_task = asyncio.create_task(currency_converter.refresh_loop())
+        if db.write_behind:
+            # Send transactions journaled before the last shutdown
+            db.write_behind.start()
+        
+        # Each worker serves its own metrics on METRICS_PORT + worker index
+        metrics_server = None
+        if METRICS_PORT:
+            metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT + WORKER_INDEX)
+        
+        await idle()
+        
+        # Take no new updates and let handlers already running submit their jobs
+        if consume_task:
+            stopping.set()
+            await consume_task
+        await stop_handlers(app)
+        # Finish messages already acknowledged before the client disconnects
+        await jobs.stop(JOB_DRAIN_TIMEOUT)
+        if db.write_behind:
+            await db.write_behind.stop()
+        
+        if metrics_server:
+            metrics_server.close()
+        
+        for task in (heartbeat_task, rates_task):
+            if task:
+                task.cancel()
+        if ai_parser.yandex_speech:
+            await ai_parser.yandex_speech.close()
+        await db.close()
 
 if __name__ == "__main__":
     print("🤖 Calco AI Bot is starting...")
-    app.run()
+    app.run(serve())
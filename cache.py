@@ -0,0 +1,107 @@
+"""
+In-process caches for Calco AI
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        """
+        Bounded LRU cache whose entries expire after ttl seconds
+
+        Args:
+            maxsize: Maximum number of entries; least recently used are evicted first
+            ttl: Default entry lifetime in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Like get(), but without counting a hit or miss or refreshing recency"""
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.time():
+            return default
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (value, time.time() + (ttl or self.ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def save(self, path: str):
+        """Write unexpired entries to a JSON file (keys must be strings)"""
+        now = time.time()
+        entries = [
+            [key, value, expires_at]
+            for key, (value, expires_at) in self._data.items()
+            if expires_at > now
+        ]
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Cache save error: {e}")
+
+    def load(self, path: str):
+        """Load entries written by save(); a missing or broken file is ignored"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Cache load error: {e}")
+            return
+
+        now = time.time()
+        for key, value, expires_at in entries:
+            if expires_at > now:
+                self._data[key] = (value, expires_at)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -15,6 +15,96 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 if not all([BOT_TOKEN, API_ID, API_HASH, OPENAI_API_KEY, SUPABASE_URL, SUPABASE_KEY]):
     raise ValueError("Missing required environment variables. Please check your .env or Railway settings.")
 
+# Database connection settings
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT") or "10")  # seconds per query
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or "20")  # max open connections
+DB_KEEPALIVE = int(os.getenv("DB_KEEPALIVE") or "10")  # idle connections kept alive
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE") or "10000")  # cached user profiles
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL") or "600")  # seconds
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL") or "60")  # seconds a prefetched history page is kept
+
+# OpenAI request settings (the model must support structured outputs)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY") or "20")  # requests in flight
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT") or "20")  # seconds per attempt
+OPENAI_DEADLINE = float(os.getenv("OPENAI_DEADLINE") or "60")  # seconds per call, including queueing and retries
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES") or "3")  # on 429, 5xx and connection errors
+# Account rate limits the scheduler stays under (0 = unlimited); with several workers each
+# one gets OPENAI_RPM / WORKER_COUNT and OPENAI_TPM / WORKER_COUNT
+OPENAI_RPM = float(os.getenv("OPENAI_RPM") or "500")  # requests per minute
+OPENAI_TPM = float(os.getenv("OPENAI_TPM") or "200000")  # tokens per minute
+
+# Messages arriving within LLM_BATCH_WAIT_MS of each other are extracted with one GPT call,
+# up to LLM_BATCH_SIZE messages per call (1 = no batching)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE") or "1")
+LLM_BATCH_WAIT_MS = float(os.getenv("LLM_BATCH_WAIT_MS") or "30")
+
+# Messages the local parser scores below this confidence are sent to GPT
+FAST_PARSE_THRESHOLD = float(os.getenv("FAST_PARSE_THRESHOLD") or "0.8")
+
+# Background processing of messages: workers running at once, and how many acknowledged
+# messages may wait before handlers block; seconds to finish queued work on shutdown
+JOB_WORKERS = int(os.getenv("JOB_WORKERS") or "20")
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE") or "200")
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT") or "30")
+
+# Voice messages larger than this are rejected before download
+VOICE_MAX_BYTES = int(os.getenv("VOICE_MAX_BYTES") or str(10 * 1024 * 1024))
+
+# Seconds before the next speech recognizer is started alongside a slow one (0 = all at once)
+STT_HEDGE_DELAY = float(os.getenv("STT_HEDGE_DELAY") or "3")
+
+# Longer voice notes are split on pauses into segments of at most this many seconds
+# and recognized in parallel (Yandex synchronous recognition accepts up to 30 s; 0 = never split)
+STT_CHUNK_SECONDS = float(os.getenv("STT_CHUNK_SECONDS") or "25")
+
+# Transcripts of recent voice notes, keyed by Telegram file_unique_id
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE") or "2000")
+TRANSCRIPT_CACHE_TTL = float(os.getenv("TRANSCRIPT_CACHE_TTL") or "86400")  # seconds
+
+# Yandex SpeechKit HTTP client (seconds / connections)
+YANDEX_CONNECT_TIMEOUT = float(os.getenv("YANDEX_CONNECT_TIMEOUT") or "3")
+YANDEX_READ_TIMEOUT = float(os.getenv("YANDEX_READ_TIMEOUT") or "15")
+YANDEX_MAX_RETRIES = int(os.getenv("YANDEX_MAX_RETRIES") or "2")
+YANDEX_POOL_SIZE = int(os.getenv("YANDEX_POOL_SIZE") or "10")
+
+# Cache of GPT parse results; set PARSE_CACHE_FILE to keep it across restarts
+# (workers use PARSE_CACHE_FILE.<index>). Results with dates other than today aren't cached.
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE") or "5000")
+PARSE_CACHE_TTL = float(os.getenv("PARSE_CACHE_TTL") or "86400")  # seconds
+PARSE_CACHE_FILE = os.getenv("PARSE_CACHE_FILE")
+
+# Conversation state: "memory" (single process) or "sqlite" (shared by workers on one host)
+STATE_BACKEND = os.getenv("STATE_BACKEND") or "memory"
+STATE_DB_PATH = os.getenv("STATE_DB_PATH") or "states.db"
+STATE_TTL = float(os.getenv("STATE_TTL") or "3600")  # abandoned flows expire after this many seconds
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS") or "10000")
+
+# Exchange rates: "cbu" (Central Bank of Uzbekistan), "file" (RATE_FILE JSON) or "static"
+RATE_SOURCE = os.getenv("RATE_SOURCE") or "cbu"
+RATE_FILE = os.getenv("RATE_FILE") or "rates.json"
+RATE_REFRESH_INTERVAL = float(os.getenv("RATE_REFRESH_INTERVAL") or "21600")  # seconds
+RATE_HISTORY_FILE = os.getenv("RATE_HISTORY_FILE") or ""  # keep rates by date across restarts
+RATE_HISTORY_DAYS = int(os.getenv("RATE_HISTORY_DAYS") or "730")
+
+# Write-behind for new transactions: set WRITE_BEHIND_FILE to journal them locally (fsync'd),
+# reply at once and insert them in batches every WRITE_BEHIND_INTERVAL_MS or WRITE_BEHIND_BATCH
+# rows (needs sql/write_behind.sql; workers use WRITE_BEHIND_FILE.<index>). Rows the database
+# rejects as invalid are moved to <file>.dead
+WRITE_BEHIND_FILE = os.getenv("WRITE_BEHIND_FILE") or ""
+WRITE_BEHIND_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS") or "500")
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH") or "100")
+
+# Multi-process mode (see supervisor.py): worker N of WORKER_COUNT handles its share of users;
+# a separate receiver session takes all updates and forwards them (see dispatch.py)
+WORKER_COUNT = int(os.getenv("WORKER_COUNT") or "1")
+WORKER_INDEX = int(os.getenv("WORKER_INDEX") or "0")
+SESSION_NAME = "calco_bot" if WORKER_COUNT == 1 else f"calco_bot_{WORKER_INDEX}"
+
+# Prometheus metrics endpoint (GET /metrics); worker N listens on METRICS_PORT + N, 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST") or "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "9100")
+
 # Language settings
 LANGUAGES = {
     "uz": "🇺🇿 O'zbek",
@@ -1,12 +1,20 @@
 """
 Currency converter for Calco AI
-Uses exchange rates to convert between currencies
+Converts with an in-memory snapshot of exchange rates that a background task
+refreshes from a pluggable source. Conversion itself never does I/O.
 """
+import asyncio
+import json
+import os
 import requests
-from typing import Optional
+import tempfile
+from bisect import bisect_right
+from datetime import date, datetime
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Union
+from config import RATE_SOURCE, RATE_FILE, RATE_HISTORY_FILE, RATE_HISTORY_DAYS, RATE_REFRESH_INTERVAL
 
-# Exchange rates (UZS as base)
-# Update these periodically or use an API
+# Fallback exchange rates (UZS as base), used until the first refresh succeeds
 EXCHANGE_RATES = {
     "UZS": 1,
     "USD": 12700,  # 1 USD = 12700 UZS
@@ -15,11 +23,70 @@ EXCHANGE_RATES = {
     "KZT": 26,     # 1 KZT = 26 UZS
 }
 
+# Rate sources: fetch() returns (date, {currency: UZS per unit}) and may block
+
+class StaticRateSource:
+    """Fixed rates - for tests and offline runs"""
+    
+    def __init__(self, rates: Dict[str, float] = EXCHANGE_RATES):
+        self.rates = dict(rates)
+    
+    def fetch(self):
+        return date.today(), dict(self.rates)
+
+class FileRateSource:
+    """JSON file with {"date": "YYYY-MM-DD", "rates": {...}} or just {...}"""
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    def fetch(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if "rates" in data:
+            return date.fromisoformat(data.get("date") or date.today().isoformat()), data["rates"]
+        return date.today(), data
+
+class CBURateSource:
+    """Official daily rates of the Central Bank of Uzbekistan"""
+    URL = "https://cbu.uz/uz/arkhiv-kursov-valyut/json/"
+    
+    def __init__(self, timeout: float = 10):
+        self.timeout = timeout
+    
+    def fetch(self):
+        response = requests.get(self.URL, timeout=self.timeout)
+        response.raise_for_status()
+        rates = {"UZS": 1}
+        rates_date = date.today()
+        for item in response.json():
+            # Rate is quoted per `Nominal` units of the currency
+            rates[item["Ccy"]] = float(item["Rate"]) / float(item.get("Nominal") or 1)
+            rates_date = datetime.strptime(item["Date"], "%d.%m.%Y").date()
+        return rates_date, rates
+
+def create_rate_source():
+    """Build the source selected by RATE_SOURCE ("cbu", "file" or "static")"""
+    if RATE_SOURCE == "file":
+        return FileRateSource(RATE_FILE)
+    if RATE_SOURCE == "static":
+        return StaticRateSource()
+    return CBURateSource()
+
 class CurrencyConverter:
-    def __init__(self):
-        self.rates = EXCHANGE_RATES
+    def __init__(self, source=None, history_file: str = RATE_HISTORY_FILE):
+        self.source = source or create_rate_source()
+        self.history_file = history_file
+        
+        # Read-only snapshots replaced as a whole, so readers never see a half-updated table
+        self.rates: Mapping[str, float] = MappingProxyType(dict(EXCHANGE_RATES))
+        self.history: Dict[str, Mapping[str, float]] = {}
+        self.history_dates = []
+        if history_file:
+            self._load_history()
     
-    def convert(self, amount: float, from_currency: str, to_currency: str) -> float:
+    def convert(self, amount: float, from_currency: str, to_currency: str,
+                on_date: Optional[Union[date, str]] = None) -> float:
         """
         Convert amount from one currency to another
         
@@ -27,6 +94,7 @@ class CurrencyConverter:
             amount: Amount to convert
             from_currency: Source currency code (USD, EUR, UZS, etc.)
             to_currency: Target currency code
+            on_date: Use the rates known on this date (latest rates if omitted or unknown)
         
         Returns:
             Converted amount
@@ -38,49 +106,89 @@ class CurrencyConverter:
         if from_currency == to_currency:
             return amount
         
+        rates = self.rates_on(on_date) if on_date else self.rates
+        
         # Convert to UZS first, then to target currency
-        if from_currency not in self.rates or to_currency not in self.rates:
+        if from_currency not in rates or to_currency not in rates:
             # Unknown currency, return original amount
             return amount
         
         # Convert from source to UZS
-        amount_in_uzs = amount * self.rates[from_currency]
+        amount_in_uzs = amount * rates[from_currency]
         
         # Convert from UZS to target
-        result = amount_in_uzs / self.rates[to_currency]
+        result = amount_in_uzs / rates[to_currency]
         
         return round(result, 2)
     
-    def detect_currency(self, text: str) -> Optional[str]:
-        """
-        Detect currency mentioned in text
-        Returns currency code or None
-        """
-        text_upper = text.upper()
-        
-        # Check for currency symbols and codes
-        currency_patterns = {
-            "$": "USD",
-            "USD": "USD",
-            "DOLLAR": "USD",
-            "€": "EUR",
-            "EUR": "EUR",
-            "EURO": "EUR",
-            "₽": "RUB",
-            "RUB": "RUB",
-            "RUBLE": "RUB",
-            "₸": "KZT",
-            "KZT": "KZT",
-            "TENGE": "KZT",
-            "SOM": "UZS",
-            "SO'M": "UZS",
-            "UZS": "UZS",
-        }
-        
-        for pattern, currency in currency_patterns.items():
-            if pattern in text_upper:
-                return currency
+    def rates_on(self, on_date: Union[date, str]) -> Mapping[str, float]:
+        """Rates of the latest recorded day on or before on_date"""
+        key = on_date.isoformat() if isinstance(on_date, date) else str(on_date)[:10]
+        dates = self.history_dates
+        index = bisect_right(dates, key)
+        if index == 0:
+            return self.rates
+        return self.history[dates[index - 1]]
+    
+    def refresh(self) -> bool:
+        """Fetch rates from the source (blocking) and publish them; keeps old rates on failure"""
+        try:
+            rates_date, rates = self.source.fetch()
+        except Exception as e:
+            print(f"⚠️  Exchange rate refresh failed: {e}")
+            return False
         
-        return None
+        snapshot = MappingProxyType({code.upper(): float(rate) for code, rate in rates.items()})
+        self._record(rates_date.isoformat(), snapshot)
+        self.rates = snapshot
+        if self.history_file:
+            self._save_history()
+        return True
+    
+    async def refresh_loop(self, interval: float = RATE_REFRESH_INTERVAL):
+        """Refresh rates in a worker thread now and then every `interval` seconds"""
+        while True:
+            await asyncio.to_thread(self.refresh)
+            await asyncio.sleep(interval)
+    
+    def _record(self, day: str, snapshot: Mapping[str, float]):
+        history = dict(self.history)
+        history[day] = snapshot
+        dates = sorted(history)[-RATE_HISTORY_DAYS:]
+        self.history = {d: history[d] for d in dates}
+        self.history_dates = dates
+    
+    def _save_history(self):
+        # Workers share the history file, so each writes its own temporary file
+        directory, name = os.path.split(os.path.abspath(self.history_file))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory)
+        except OSError as e:
+            print(f"Exchange rate history save error: {e}")
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({day: dict(rates) for day, rates in self.history.items()}, f)
+            os.replace(tmp_path, self.history_file)
+        except OSError as e:
+            print(f"Exchange rate history save error: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    
+    def _load_history(self):
+        try:
+            with open(self.history_file, encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Exchange rate history load error: {e}")
+            return
+        for day in sorted(stored):
+            self._record(day, MappingProxyType(stored[day]))
+        if self.history_dates:
+            self.rates = self.history[self.history_dates[-1]]
 
 currency_converter = CurrencyConverter()
@@ -1,22 +1,84 @@
-from supabase import create_client
-from config import SUPABASE_URL, SUPABASE_KEY
+import asyncio
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.types import ReturnMethod
+from config import (
+    SUPABASE_URL, SUPABASE_KEY, DB_TIMEOUT, DB_POOL_SIZE, DB_KEEPALIVE,
+    USER_CACHE_SIZE, USER_CACHE_TTL, HISTORY_CACHE_TTL, WRITE_BEHIND_FILE,
+    WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_BATCH, WORKER_COUNT, WORKER_INDEX
+)
+from cache import TTLCache
+from write_behind import WriteBehindBuffer
+from metrics import track_db
 from datetime import datetime, date
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, Union
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    """PostgREST client with a shared keep-alive connection pool"""
+    def create_session(self, base_url, headers, timeout) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=DB_POOL_SIZE,
+                max_keepalive_connections=DB_KEEPALIVE
+            )
+        )
 
 class Database:
     def __init__(self):
         try:
-            self.client = create_client(SUPABASE_URL, SUPABASE_KEY)
+            self.client = PooledPostgrestClient(
+                f"{SUPABASE_URL}/rest/v1",
+                headers={
+                    "apiKey": SUPABASE_KEY,
+                    "Authorization": f"Bearer {SUPABASE_KEY}"
+                },
+                timeout=DB_TIMEOUT
+            )
         except Exception as e:
             print(f"Database connection error: {e}")
             raise
-    
+        
+        # User profiles are read on every update but rarely change
+        self.user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        
+        # Prefetched history pages per user; dropped whenever the user's transactions change
+        self.history_cache = TTLCache(USER_CACHE_SIZE, HISTORY_CACHE_TTL)
+        self.prefetch_tasks = set()
+        
+        # Optionally acknowledge new transactions once journaled locally and insert them in batches
+        self.write_behind = None
+        if WRITE_BEHIND_FILE:
+            path = WRITE_BEHIND_FILE if WORKER_COUNT == 1 else f"{WRITE_BEHIND_FILE}.{WORKER_INDEX}"
+            self.write_behind = WriteBehindBuffer(
+                path, self._upsert_transactions, WRITE_BEHIND_INTERVAL_MS / 1000, WRITE_BEHIND_BATCH
+            )
+
+    async def execute(self, query, timeout: Optional[float] = None):
+        """Run a query with a per-call deadline"""
+        return await asyncio.wait_for(query.execute(), timeout or DB_TIMEOUT)
+
+    async def close(self):
+        await self.client.aclose()
+
     # User operations
-    def get_user(self, telegram_id: int) -> Optional[Dict]:
-        response = self.client.table("users").select("*").eq("telegram_id", telegram_id).execute()
-        return response.data[0] if response.data else None
-    
-    def create_user(self, telegram_id: int, name: str, language: str = "uz", currency: str = "UZS") -> Dict:
+    @track_db
+    async def get_user(self, telegram_id: int) -> Optional[Dict]:
+        user = self.user_cache.get(telegram_id)
+        if user is not None:
+            return user
+        
+        response = await self.execute(self.client.table("users").select("*").eq("telegram_id", telegram_id))
+        if not response.data:
+            return None
+        
+        self.user_cache.set(telegram_id, response.data[0])
+        return response.data[0]
+
+    @track_db
+    async def create_user(self, telegram_id: int, name: str, language: str = "uz", currency: str = "UZS") -> Dict:
         data = {
             "telegram_id": telegram_id,
             "name": name,
@@ -24,19 +86,40 @@ class Database:
             "currency": currency,
             "created_at": datetime.now().isoformat()
         }
-        response = self.client.table("users").insert(data).execute()
+        response = await self.execute(self.client.table("users").insert(data))
+        self.user_cache.set(telegram_id, response.data[0])
         return response.data[0]
-    
-    def update_user_language(self, telegram_id: int, language: str):
-        self.client.table("users").update({"language": language}).eq("telegram_id", telegram_id).execute()
-    
-    def update_user_currency(self, telegram_id: int, currency: str):
-        self.client.table("users").update({"currency": currency}).eq("telegram_id", telegram_id).execute()
-    
+
+    @track_db
+    async def update_user_language(self, telegram_id: int, language: str):
+        await self._update_user(telegram_id, {"language": language})
+
+    @track_db
+    async def update_user_currency(self, telegram_id: int, currency: str):
+        await self._update_user(telegram_id, {"currency": currency})
+
+    async def _update_user(self, telegram_id: int, fields: Dict):
+        """Update a user row and write the new row through the cache"""
+        try:
+            response = await self.execute(self.client.table("users").update(fields).eq("telegram_id", telegram_id))
+        except:
+            self.user_cache.pop(telegram_id)
+            raise
+        if response.data:
+            self.user_cache.set(telegram_id, response.data[0])
+        else:
+            self.user_cache.pop(telegram_id)
+
     # Transaction operations
-    def add_transaction(self, user_id: int, amount: float, trans_type: str, 
-                       category: str, description: str, trans_date: Optional[date] = None) -> Dict:
-        data = {
+    def _transaction_row(self, user_id: int, amount: float, trans_type: str, category: str,
+                         description: str, trans_date: Optional[Union[date, str]] = None) -> Dict:
+        if isinstance(trans_date, str):
+            # Parsed dates are YYYY-MM-DD strings; anything else falls back to today
+            try:
+                trans_date = date.fromisoformat(trans_date)
+            except ValueError:
+                trans_date = None
+        return {
             "user_id": user_id,
             "amount": amount,
             "type": trans_type,
@@ -44,65 +127,176 @@ class Database:
             "description": description,
             "date": (trans_date or date.today()).isoformat()
         }
-        response = self.client.table("transactions").insert(data).execute()
+
+    @track_db
+    async def add_transaction(self, user_id: int, amount: float, trans_type: str, category: str,
+                              description: str, trans_date: Optional[Union[date, str]] = None) -> Dict:
+        data = self._transaction_row(user_id, amount, trans_type, category, description, trans_date)
+        if self.write_behind:
+            self.history_cache.pop(user_id)
+            return (await self.write_behind.add([data]))[0]
+        response = await self.execute(self.client.table("transactions").insert(data))
+        self.history_cache.pop(user_id)
         return response.data[0]
-    
-    def get_transactions(self, user_id: int, limit: int = 10) -> List[Dict]:
-        response = self.client.table("transactions")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .order("date", desc=True)\
-            .order("id", desc=True)\
-            .limit(limit)\
-            .execute()
+
+    @track_db
+    async def add_transactions(self, user_id: int, transactions: List[Dict]) -> List[Dict]:
+        """
+        Insert several parsed transactions in one request, each under its parsed date
+        (the date its amount was converted at).
+        PostgREST runs a bulk insert as a single statement, so either all rows are saved or none.
+        """
+        rows = [
+            self._transaction_row(user_id, trans["amount"], trans["type"],
+                                  trans["category"], trans["description"], trans.get("date"))
+            for trans in transactions
+        ]
+        if not rows:
+            return []
+        if self.write_behind:
+            self.history_cache.pop(user_id)
+            return await self.write_behind.add(rows)
+        response = await self.execute(self.client.table("transactions").insert(rows))
+        self.history_cache.pop(user_id)
         return response.data
-    
-    def get_transaction_by_id(self, transaction_id: int) -> Optional[Dict]:
-        response = self.client.table("transactions")\
-            .select("*")\
-            .eq("id", transaction_id)\
-            .execute()
+
+    @track_db
+    async def _upsert_transactions(self, rows: List[Dict]):
+        """Write-behind batch insert; rows already stored under the same idempotency_key are skipped"""
+        await self.execute(
+            self.client.table("transactions")
+            .upsert(rows, on_conflict="idempotency_key", ignore_duplicates=True, returning=ReturnMethod.minimal)
+        )
+        for user_id in {row["user_id"] for row in rows}:
+            self.history_cache.pop(user_id)
+
+    async def _flush_writes(self, user_id: int):
+        """Send the user's journaled transactions before reading transactions back"""
+        if self.write_behind and self.write_behind.has_pending(user_id):
+            await self.write_behind.flush()
+
+    @track_db
+    async def get_transactions(self, user_id: int, limit: int = 10,
+                               before: Optional[Tuple[str, int]] = None,
+                               after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+        """
+        Newest-first page of a user's transactions.
+        before/after are (date, id) cursors: rows older than `before` or newer than
+        `after`. Keyset filters use the (user_id, date, id) index, so every page
+        costs the same however deep the user scrolls (sql/transactions_history.sql).
+        """
+        key = (limit, before, after)
+        pages = self.history_cache.get(user_id)
+        if pages and key in pages:
+            return pages[key]
+        return await self._fetch_transactions(user_id, limit, before, after)
+
+    async def _fetch_transactions(self, user_id: int, limit: int,
+                                  before: Optional[Tuple[str, int]],
+                                  after: Optional[Tuple[str, int]]) -> List[Dict]:
+        await self._flush_writes(user_id)
+        query = self.client.table("transactions").select("*").eq("user_id", user_id)
+        newest_first = after is None
+        if before:
+            query = query.or_(f"date.lt.{before[0]},and(date.eq.{before[0]},id.lt.{before[1]})")
+        if after:
+            query = query.or_(f"date.gt.{after[0]},and(date.eq.{after[0]},id.gt.{after[1]})")
+        
+        response = await self.execute(
+            query
+            .order("date", desc=newest_first)
+            .order("id", desc=newest_first)
+            .limit(limit)
+        )
+        return response.data if newest_first else response.data[::-1]
+
+    def prefetch_transactions(self, user_id: int, limit: int = 10,
+                              before: Optional[Tuple[str, int]] = None):
+        """Load the next history page in the background so paging to it is instant"""
+        key = (limit, before, None)
+        # peek: a background fill isn't a lookup, so it mustn't count as a cache miss
+        pages = self.history_cache.peek(user_id)
+        if pages is None:
+            pages = {}
+            self.history_cache.set(user_id, pages)
+        if key in pages:
+            return
+        
+        async def fetch():
+            try:
+                # A write in the meantime drops `pages` from the cache, so a stale
+                # result lands in a dict nobody reads
+                pages[key] = await self._fetch_transactions(user_id, limit, before, None)
+            except Exception as e:
+                print(f"History prefetch error: {e}")
+        
+        task = asyncio.create_task(fetch())
+        self.prefetch_tasks.add(task)
+        task.add_done_callback(self.prefetch_tasks.discard)
+
+    @track_db
+    async def get_transaction_by_id(self, transaction_id: int) -> Optional[Dict]:
+        response = await self.execute(
+            self.client.table("transactions")
+            .select("*")
+            .eq("id", transaction_id)
+        )
         return response.data[0] if response.data else None
-    
-    def delete_transaction(self, transaction_id: int, user_id: int) -> bool:
+
+    @track_db
+    async def delete_transaction(self, transaction_id: int, user_id: int) -> bool:
         try:
-            self.client.table("transactions")\
-                .delete()\
-                .eq("id", transaction_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            await self.execute(
+                self.client.table("transactions")
+                .delete()
+                .eq("id", transaction_id)
+                .eq("user_id", user_id)
+            )
+            self.history_cache.pop(user_id)
             return True
         except:
             return False
-    
-    def get_monthly_summary(self, user_id: int, year: int, month: int) -> Dict:
+
+    @track_db
+    async def get_monthly_summary(self, user_id: int, year: int, month: int,
+                                  include_transactions: bool = True) -> Dict:
+        """
+        Income/expense totals, counts and per-category totals for a month.
+        Aggregation runs in the database (sql/monthly_summary.sql); raw rows are
+        only downloaded when include_transactions is set.
+        """
         start_date = date(year, month, 1)
         if month == 12:
             end_date = date(year + 1, 1, 1)
         else:
             end_date = date(year, month + 1, 1)
-        
-        response = self.client.table("transactions")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .gte("date", start_date.isoformat())\
-            .lt("date", end_date.isoformat())\
-            .execute()
-        
-        transactions = response.data
-        income = sum(t["amount"] for t in transactions if t["type"] == "income")
-        expense = sum(t["amount"] for t in transactions if t["type"] == "expense")
-        
-        return {
-            "income": income,
-            "expense": expense,
-            "balance": income - expense,
-            "transactions": transactions
-        }
-    
+
+        await self._flush_writes(user_id)
+        response = await self.execute(self.client.rpc("monthly_summary", {
+            "p_user_id": user_id,
+            "p_start": start_date.isoformat(),
+            "p_end": end_date.isoformat()
+        }))
+
+        summary = response.data[0]
+        summary["balance"] = summary["income"] - summary["expense"]
+
+        if include_transactions:
+            transactions = await self.execute(
+                self.client.table("transactions")
+                .select("*")
+                .eq("user_id", user_id)
+                .gte("date", start_date.isoformat())
+                .lt("date", end_date.isoformat())
+            )
+            summary["transactions"] = transactions.data
+
+        return summary
+
     # Loan operations
-    def add_loan(self, user_id: int, person_name: str, amount: float, 
-                 return_date: Optional[date] = None) -> Dict:
+    @track_db
+    async def add_loan(self, user_id: int, person_name: str, amount: float,
+                       return_date: Optional[date] = None) -> Dict:
         data = {
             "user_id": user_id,
             "person_name": person_name,
@@ -111,17 +305,19 @@ class Database:
             "return_date": return_date.isoformat() if return_date else None,
             "status": "pending"
         }
-        response = self.client.table("loans").insert(data).execute()
+        response = await self.execute(self.client.table("loans").insert(data))
         return response.data[0]
-    
-    def get_loans(self, user_id: int, status: Optional[str] = None) -> List[Dict]:
+
+    @track_db
+    async def get_loans(self, user_id: int, status: Optional[str] = None) -> List[Dict]:
         query = self.client.table("loans").select("*").eq("user_id", user_id)
         if status:
             query = query.eq("status", status)
-        response = query.order("given_date", desc=True).execute()
+        response = await self.execute(query.order("given_date", desc=True))
         return response.data
-    
-    def mark_loan_paid(self, loan_id: int):
-        self.client.table("loans").update({"status": "paid"}).eq("id", loan_id).execute()
+
+    @track_db
+    async def mark_loan_paid(self, loan_id: int):
+        await self.execute(self.client.table("loans").update({"status": "paid"}).eq("id", loan_id))
 
 db = Database()
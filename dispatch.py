@@ -0,0 +1,116 @@
+"""
+Update routing for multi-process mode
+Telegram does not promise that several sessions of one bot each receive every
+update, so a single receiver process (the only session that accepts updates)
+forwards each raw update to the queue of the worker that owns the user. Workers
+run with no_updates=True and feed those updates to their own handlers, so one
+user's updates stay in order on one process and none are lost or duplicated.
+"""
+import asyncio
+import queue
+import time
+import zlib
+from io import BytesIO
+from typing import List, Optional
+from pyrogram import Client, idle
+from pyrogram.raw.core import TLObject
+
+RECEIVER_SESSION_NAME = "calco_bot_receiver"
+
+async def send_heartbeats(heartbeat, interval: float = 5):
+    """Tell the supervisor this process's event loop is alive"""
+    while True:
+        heartbeat.value = time.time()
+        await asyncio.sleep(interval)
+
+def update_user_id(update) -> Optional[int]:
+    """Telegram id of the user an update comes from (None for updates without one)"""
+    user_id = getattr(update, "user_id", None)  # callback and inline queries
+    if user_id is not None:
+        return user_id
+    message = getattr(update, "message", None)  # new and edited messages
+    for peer in (getattr(message, "from_id", None), getattr(message, "peer_id", None)):
+        user_id = getattr(peer, "user_id", None)
+        if user_id is not None:
+            return user_id
+    return None
+
+def worker_for(user_id: Optional[int], count: int) -> int:
+    """Index of the worker that owns a user (stable hash of the Telegram id)"""
+    if user_id is None:
+        return 0
+    return zlib.crc32(str(user_id).encode()) % count
+
+def encode(update, users: dict, chats: dict) -> tuple:
+    return update.write(), [u.write() for u in users.values()], [c.write() for c in chats.values()]
+
+def decode(data: tuple) -> tuple:
+    update, users, chats = data
+    users = [TLObject.read(BytesIO(u)) for u in users]
+    chats = [TLObject.read(BytesIO(c)) for c in chats]
+    return (
+        TLObject.read(BytesIO(update)),
+        {u.id: u for u in users},
+        {c.id: c for c in chats}
+    )
+
+async def receive(queues: List, heartbeat=None):
+    """Receiver process: accept updates and forward each one to its worker's queue"""
+    from config import API_ID, API_HASH, BOT_TOKEN
+
+    # One handler task, so updates are forwarded in the order they arrive
+    client = Client(RECEIVER_SESSION_NAME, api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN, workers=1)
+
+    @client.on_raw_update()
+    async def forward(client: Client, update, users: dict, chats: dict):
+        index = worker_for(update_user_id(update), len(queues))
+        try:
+            queues[index].put_nowait(encode(update, users, chats))
+        except queue.Full:
+            print(f"⚠️  Worker {index} queue is full, update dropped")
+
+    async with client:
+        # Keep a reference so the task isn't garbage collected
+        heartbeat_task = asyncio.create_task(send_heartbeats(heartbeat)) if heartbeat is not None else None
+        await idle()
+        if heartbeat_task:
+            heartbeat_task.cancel()
+
+async def _ignore_updates(updates):
+    pass
+
+async def start_handlers(client: Client):
+    """Start the handler tasks of a no_updates client (Pyrogram skips them for such clients)"""
+    # Anything Telegram still pushes to this session arrives through the receiver too
+    client.handle_updates = _ignore_updates
+    client.no_updates = False
+    try:
+        await client.dispatcher.start()
+    finally:
+        client.no_updates = True
+
+async def stop_handlers(client: Client):
+    """Let queued updates finish and stop the handler tasks (for any client)"""
+    no_updates = client.no_updates
+    client.no_updates = False
+    try:
+        await client.dispatcher.stop()
+    finally:
+        client.no_updates = no_updates
+
+async def consume(client: Client, updates, stopping: asyncio.Event):
+    """
+    Worker side: hand updates forwarded by the receiver to the client's handlers
+    until stopping is set. Don't cancel this task: an update the reader thread has
+    already taken off the queue would be lost.
+    """
+    while not stopping.is_set():
+        try:
+            data = await asyncio.to_thread(updates.get, True, 1)
+        except queue.Empty:
+            continue
+        update, users, chats = decode(data)
+        # Store access hashes so replies to these users and chats resolve
+        await client.fetch_peers(list(users.values()))
+        await client.fetch_peers(list(chats.values()))
+        client.dispatcher.updates_queue.put_nowait((update, users, chats))
@@ -0,0 +1,198 @@
+"""
+Local rule-based parser for simple single-amount messages
+Handles "15000 non", "5$ taxi", "500000 ish haqi" without calling GPT
+"""
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from config import EXPENSE_CATEGORIES, INCOME_CATEGORIES
+from utils import validate_amount
+
+# Category keys in the same order as the category lists in config.py
+EXPENSE_KEYS = ["food", "transport", "housing", "health", "entertainment", "shopping", "education", "other"]
+INCOME_KEYS = ["salary", "business", "gift", "investment", "other"]
+
+# Extra keywords (uz/ru/en) on top of the words in the config category names.
+# Keywords match at the start of a word, so stems like "зарплат" cover all endings.
+EXPENSE_KEYWORDS = {
+    "food": ["non", "kofe", "choy", "ovqat", "tushlik", "nonushta", "kechki ovqat", "somsa", "osh",
+             "lavash", "hotdog", "burger", "pizza", "kabob", "shashlik", "bozor", "market",
+             "хлеб", "кофе", "чай", "обед", "завтрак", "ужин", "продукт", "кафе", "ресторан",
+             "bread", "coffee", "tea", "food", "lunch", "breakfast", "dinner", "grocer", "cafe",
+             "restaurant", "meal"],
+    "transport": ["taksi", "taxi", "metro", "avtobus", "benzin", "yoqilg'i", "yo'l kira",
+                  "такси", "метро", "автобус", "бензин", "проезд",
+                  "fuel", "petrol", "uber", "yandex go"],
+    "housing": ["ijara", "kvartira", "kommunal", "svet", "gaz", "internet",
+                "аренд", "квартир", "коммунал", "свет", "газ", "интернет",
+                "rent", "utilities", "electricity"],
+    "health": ["dori", "apteka", "dorixona", "shifokor", "doktor", "kasalxona",
+               "аптек", "лекарств", "врач", "больниц",
+               "pharmacy", "medicine", "doctor", "hospital"],
+    "entertainment": ["kino", "konsert", "кино", "игр", "концерт",
+                      "cinema", "movie", "game", "concert"],
+    "shopping": ["kiyim", "do'kon", "oyoq kiyim", "одежд", "магазин", "обув",
+                 "clothes", "shop", "shoes"],
+    "education": ["kurs", "kitob", "o'qish", "darslik", "kontrakt",
+                  "курс", "книг", "учеб", "обучен",
+                  "course", "book", "tuition", "school"],
+    "other": [],
+}
+
+INCOME_KEYWORDS = {
+    "salary": ["oylik", "maosh", "avans", "зарплат", "зп", "аванс", "salary", "wage", "paycheck"],
+    "business": ["savdo", "foyda", "продаж", "прибыл", "business", "profit", "sales"],
+    "gift": ["sovg'a", "подар", "gift", "present"],
+    "investment": ["dividend", "дивиденд", "investment"],
+    "other": [],
+}
+
+# Gifts are given as often as received, so the direction is left to GPT
+AMBIGUOUS_KEYS = {"gift"}
+
+# 15000 / 15 000 / 15,000 / 1.500.000 / 5.5, optionally followed by a multiplier
+NUMBER_RE = re.compile(r"(?<![\w.,])(\d{1,3}(?:[ .,]\d{3})+|\d+)(?:[.,](\d{1,2}))?(?![\d])")
+MULTIPLIER_WORDS = r"(k|ming|тыс\w*|mln|млн|million)(?!\w)"
+MULTIPLIER_RE = re.compile(r"^\s*" + MULTIPLIER_WORDS, re.IGNORECASE)
+MULTIPLIER_TOKEN_RE = re.compile(r"(?<!\w)" + MULTIPLIER_WORDS, re.IGNORECASE)
+MULTIPLIERS = {"k": 1000, "ming": 1000, "тыс": 1000, "mln": 1000000, "млн": 1000000, "million": 1000000}
+
+# Whole-word currency mentions; endings are spelled out so "rubashka" or "сумка" don't match
+CURRENCY_TOKEN_RE = re.compile(
+    r"[$€₽₸]|(?<!\w)(usd|eur|euro|rub|rubl\w*|kzt|tenge|uzs|so'm|som|dollar\w*|"
+    r"сум|сума|сумов|сумы|руб|рубл\w*|долл\w*|евро|тенге)(?!\w)",
+    re.IGNORECASE
+)
+
+# Token prefix -> ISO code, checked in order
+CURRENCY_CODES = [
+    ("$", "USD"), ("usd", "USD"), ("dollar", "USD"), ("долл", "USD"),
+    ("€", "EUR"), ("eur", "EUR"), ("евро", "EUR"),
+    ("₽", "RUB"), ("rub", "RUB"), ("руб", "RUB"),
+    ("₸", "KZT"), ("kzt", "KZT"), ("tenge", "KZT"), ("тенге", "KZT"),
+    ("uzs", "UZS"), ("so'm", "UZS"), ("som", "UZS"), ("сум", "UZS"),
+]
+
+# Currencies the rules can't convert; a message naming one goes to GPT
+OTHER_CURRENCY_RE = re.compile(
+    r"[£¥₩₺₹]|(?<!\w)(gbp|cny|jpy|aed|pound\w*|yuan|yen|lira|dirham\w*|"
+    r"фунт\w*|юан\w*|иен\w*|лир\w*|дирхам\w*|гривн\w*|uah)(?!\w)",
+    re.IGNORECASE
+)
+
+# Words that usually mean a second transaction, a date or a loan - leave those to GPT
+COMPLEX_RE = re.compile(
+    r"(?<!\w)(va|keyin|kecha|ertaga|qarz|и|потом|вчера|завтра|долг|and|then|yesterday|tomorrow|lent|borrow\w*)(?!\w)",
+    re.IGNORECASE
+)
+
+APOSTROPHES = str.maketrans({"ʻ": "'", "ʼ": "'", "‘": "'", "’": "'", "`": "'"})
+
+def _category_stems(label: str) -> List[str]:
+    """Turn a config category name like "🍔 Oziq-ovqat" into a keyword stem"""
+    word = re.sub(r"[^\w' -]", "", label).strip().lower()
+    return [word[:max(4, len(word) - 2)]] if word else []
+
+def _compile(keywords: Dict[str, List[str]], config_categories: Dict[str, List[str]], keys: List[str]) -> Dict[str, re.Pattern]:
+    words = {key: list(values) for key, values in keywords.items()}
+    for labels in config_categories.values():
+        for key, label in zip(keys, labels):
+            words[key].extend(_category_stems(label))
+
+    return {
+        key: re.compile(r"(?<!\w)(?:" + "|".join(re.escape(w) for w in sorted(set(values), key=len, reverse=True)) + ")", re.IGNORECASE)
+        for key, values in words.items() if values
+    }
+
+class FastParser:
+    def __init__(self):
+        self.expense_patterns = _compile(EXPENSE_KEYWORDS, EXPENSE_CATEGORIES, EXPENSE_KEYS)
+        self.income_patterns = _compile(INCOME_KEYWORDS, INCOME_CATEGORIES, INCOME_KEYS)
+
+    def _match_category(self, text: str, patterns: Dict[str, re.Pattern]) -> Optional[str]:
+        for key, pattern in patterns.items():
+            if pattern.search(text):
+                return key
+        return None
+
+    def _detect_currency(self, text: str) -> Tuple[Optional[str], bool]:
+        """
+        ISO code of the currency named in the text (None if none is named),
+        and whether the mention is clear - a single known currency
+        """
+        codes = set()
+        for match in CURRENCY_TOKEN_RE.finditer(text):
+            token = match.group(0).lower()
+            codes.add(next(code for prefix, code in CURRENCY_CODES if token.startswith(prefix)))
+        if OTHER_CURRENCY_RE.search(text) or len(codes) > 1:
+            return None, False
+        return (codes.pop() if codes else None), True
+
+    def _extract_amount(self, text: str) -> Optional[float]:
+        """Return the only amount in the text, or None if there is not exactly one"""
+        matches = list(NUMBER_RE.finditer(text))
+        if len(matches) != 1:
+            return None
+
+        match = matches[0]
+        integer_part = re.sub(r"[ .,]", "", match.group(1))
+        amount = validate_amount(integer_part)
+        if match.group(2):
+            amount += float("0." + match.group(2))
+
+        multiplier = MULTIPLIER_RE.match(text[match.end():])
+        if multiplier:
+            word = multiplier.group(1).lower()
+            amount *= MULTIPLIERS.get(word, MULTIPLIERS.get(word[:3], 1))
+
+        return amount if amount > 0 else None
+
+    def parse(self, text: str) -> Tuple[Optional[Dict], float]:
+        """
+        Extract a single transaction from a short message
+
+        Returns:
+            (transaction, confidence) - transaction uses the same fields as the GPT
+            result before currency conversion; confidence is between 0 and 1
+        """
+        text = text.strip().translate(APOSTROPHES)
+        if not text or COMPLEX_RE.search(text):
+            return None, 0.0
+
+        amount = self._extract_amount(text)
+        if amount is None:
+            return None, 0.0
+
+        income_key = self._match_category(text, self.income_patterns)
+        expense_key = self._match_category(text, self.expense_patterns)
+
+        confidence = 0.5
+        if income_key and expense_key:
+            confidence = 0.3
+        elif income_key in AMBIGUOUS_KEYS:
+            confidence = 0.5
+        elif income_key or expense_key:
+            confidence = 0.9
+
+        # Long sentences are more likely to hide details the rules miss
+        if len(text.split()) > 6:
+            confidence -= 0.2
+
+        currency, currency_clear = self._detect_currency(text)
+        if not currency_clear:
+            confidence = min(confidence, 0.3)
+
+        description = NUMBER_RE.sub("", OTHER_CURRENCY_RE.sub("", CURRENCY_TOKEN_RE.sub("", text)))
+        description = MULTIPLIER_TOKEN_RE.sub("", description)
+        description = " ".join(description.split()) or text
+
+        return {
+            "amount": amount,
+            "type": "income" if income_key and not expense_key else "expense",
+            "category": income_key or expense_key or "other",
+            "description": description[:100],
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "currency": currency or "UZS"
+        }, round(confidence, 2)
+
+fast_parser = FastParser()
@@ -0,0 +1,114 @@
+"""
+In-process job queue
+Handlers acknowledge a message right away and queue the slow part (GPT, speech
+recognition, database writes) here. A fixed number of workers drain the queue;
+when it is full, submit() waits, so a burst slows down update handling instead
+of piling up unbounded work. Jobs with the same key (the user's id) run one at
+a time in the order they were submitted. Jobs still queued or running when
+stop() gives up, or submitted after it, get their on_drop callback, so the user
+isn't left looking at a placeholder.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+from metrics import JOB_WAIT, JOB_LATENCY, JOB_ERRORS
+
+class JobQueue:
+    def __init__(self, workers: int, max_pending: int):
+        self.worker_count = workers
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.workers: List[asyncio.Task] = []
+        self.running: Dict[asyncio.Task, tuple] = {}  # job each worker is busy with
+        self.waiting: Dict[Hashable, Deque[tuple]] = {}  # key with a job running -> its next jobs
+        self.closed = False
+
+    def start(self):
+        """Start the workers on the running loop (submit() does this on first use)"""
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def submit(self, name: str, func: Callable, *args, key: Optional[Hashable] = None,
+                     on_drop: Optional[Callable[[], Awaitable]] = None):
+        """
+        Queue func(*args), waiting while the queue is full. Jobs sharing a key
+        never run concurrently; on_drop() runs if the job is dropped at shutdown.
+        """
+        job = (name, key, func, args, on_drop, time.perf_counter())
+        if self.closed:
+            await self._drop([job])
+            return
+        self.start()
+        await self.queue.put(job)
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            key = job[1]
+            if key is not None:
+                if key in self.waiting:
+                    # Runs after the key's current job, on that job's worker
+                    self.waiting[key].append(job)
+                    continue
+                self.waiting[key] = deque()
+
+            while job is not None:
+                await self._run(job)
+                job = None
+                if key is not None:
+                    if self.waiting[key]:
+                        job = self.waiting[key].popleft()
+                    else:
+                        del self.waiting[key]
+
+    async def _run(self, job: tuple):
+        name, _, func, args, _, queued = job
+        self.running[asyncio.current_task()] = job
+        start = time.perf_counter()
+        JOB_WAIT.observe(start - queued, name)
+        try:
+            await func(*args)
+        except Exception as e:
+            JOB_ERRORS.inc(name)
+            print(f"❌ Job {name} failed: {e}")
+        finally:
+            del self.running[asyncio.current_task()]
+            JOB_LATENCY.observe(time.perf_counter() - start, name)
+            self.queue.task_done()
+
+    async def join(self):
+        """Wait until every queued job has finished"""
+        await self.queue.join()
+
+    async def stop(self, timeout: float):
+        """
+        Let queued jobs finish for up to timeout seconds, then stop the workers.
+        Stop submitting first: later submit() calls drop their job at once.
+        """
+        self.closed = True
+        dropped = []
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            dropped = list(self.running.values())
+            for jobs in self.waiting.values():
+                dropped.extend(jobs)
+            while not self.queue.empty():
+                dropped.append(self.queue.get_nowait())
+                self.queue.task_done()
+            print(f"⚠️  {len(dropped)} jobs dropped at shutdown")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.waiting.clear()
+        await self._drop(dropped)
+
+    async def _drop(self, jobs: List[tuple]):
+        for name, _, _, _, on_drop, _ in jobs:
+            if on_drop is None:
+                continue
+            try:
+                await on_drop()
+            except Exception as e:
+                print(f"❌ Dropping job {name} failed: {e}")
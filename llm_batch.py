@@ -0,0 +1,58 @@
+"""
+Micro-batching for LLM requests
+Requests arriving within a short window are sent together as one call and the
+results handed back to each waiting caller.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+class MicroBatcher:
+    def __init__(self, send_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch: int, max_wait: float):
+        """
+        Args:
+            send_batch: Coroutine taking a list of items and returning one result per item
+            max_batch: A batch is sent as soon as it has this many items
+            max_wait: Seconds the first item of a batch waits for company
+        """
+        self.send_batch = send_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending: List[tuple] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((item, future))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        # Callers that gave up (e.g. superseded by a newer message) are dropped
+        batch = [(item, future) for item, future in self.pending if not future.done()]
+        self.pending = []
+        if not batch:
+            return
+        task = asyncio.create_task(self._send(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, batch: List[tuple]):
+        try:
+            results = await self.send_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,203 @@
+"""
+In-process metrics with a Prometheus text endpoint
+Counters and histograms are plain Python objects updated without locks (the
+bot runs on one event loop), so recording costs about a microsecond.
+"""
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds; covers in-memory handlers up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels) -> Callable:
+        """Decorator recording how long an async function takes, including failures"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *labels)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = _label_text(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class CollectedCounter:
+    """Counter whose values are read from elsewhere (e.g. cache stats) when scraped"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                 collect: Callable[[], Dict[Tuple, float]]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.collect().items():
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {value}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.register(Histogram(
+    "calco_handler_duration_seconds", "Time spent in each Telegram handler", ("handler",)))
+HANDLER_ERRORS = registry.register(Counter(
+    "calco_handler_errors_total", "Handlers that raised an exception", ("handler",)))
+JOB_WAIT = registry.register(Histogram(
+    "calco_job_wait_seconds", "Time a job spent queued before a worker picked it up", ("job",)))
+JOB_LATENCY = registry.register(Histogram(
+    "calco_job_duration_seconds", "Time spent running each background job", ("job",)))
+JOB_ERRORS = registry.register(Counter(
+    "calco_job_errors_total", "Background jobs that raised an exception", ("job",)))
+DB_LATENCY = registry.register(Histogram(
+    "calco_db_duration_seconds", "Database method latency, including cache hits", ("method",)))
+OPENAI_LATENCY = registry.register(Histogram(
+    "calco_openai_duration_seconds", "OpenAI request latency", ("endpoint",)))
+OPENAI_TOKENS = registry.register(Counter(
+    "calco_openai_tokens_total", "OpenAI tokens used, by purpose and prompt/completion", ("purpose", "kind")))
+YANDEX_LATENCY = registry.register(Histogram(
+    "calco_yandex_stt_duration_seconds", "Yandex SpeechKit request latency, including retries", ("language",)))
+STT_WINS = registry.register(Histogram(
+    "calco_stt_transcript_seconds",
+    "Time until a voice transcript arrived, by the recognizer that produced it (count = wins)", ("engine",)))
+PARSE_ROUTES = registry.register(Counter(
+    "calco_parse_route_total", "How transaction text was parsed: fast, cache or llm", ("route",)))
+PARSE_RESULTS = registry.register(Counter(
+    "calco_parse_results_total", "Transaction parse outcomes", ("result",)))
+
+def track_handler(func: Callable) -> Callable:
+    """Record latency and failures of a Pyrogram handler under its function name"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+    return wrapper
+
+def track_db(func: Callable) -> Callable:
+    """Record latency of a Database method under its name"""
+    return DB_LATENCY.time(func.__name__)(func)
+
+def register_caches(caches: Dict[str, object]):
+    """Expose hit/miss counts of TTLCache instances (read from cache.stats() when scraped)"""
+    def collect(field: str) -> Callable[[], Dict[Tuple, float]]:
+        return lambda: {(name,): cache.stats()[field] for name, cache in caches.items()}
+
+    registry.register(CollectedCounter(
+        "calco_cache_hits_total", "Cache lookups that found a value", ("cache",), collect("hits")))
+    registry.register(CollectedCounter(
+        "calco_cache_misses_total", "Cache lookups that found nothing", ("cache",), collect("misses")))
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Drain headers; the request body is never needed
+        while (await asyncio.wait_for(reader.readline(), 5)).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    """Serve GET /metrics on the running event loop"""
+    try:
+        server = await asyncio.start_server(_handle_scrape, host, port)
+    except OSError as e:
+        print(f"⚠️  Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    print(f"📈 Metrics at http://{host}:{port}/metrics")
+    return server
@@ -3,52 +3,82 @@ Monitoring script for Calco AI bot
 Shows real-time statistics and health checks
 """
 from database import db
-from datetime import datetime, timedelta
-import time
+from datetime import datetime, date, timedelta
+from postgrest.exceptions import APIError
+from typing import Dict, List
+import asyncio
 
-def get_bot_stats():
+async def count_rows(query) -> int:
+    """Server-side row count; only one row is transferred"""
+    response = await db.execute(query.limit(1))
+    return response.count or 0
+
+async def get_rollup_stats(today: date) -> Dict:
+    """Reads of the trigger-maintained tables in sql/stats_rollup.sql (shards summed by views)"""
+    totals = await db.execute(db.client.table("bot_totals_summary").select("*"))
+    today_stats = await db.execute(db.client.table("daily_summary").select("*").eq("day", today.isoformat()))
+    if not totals.data or totals.data[0]["users"] is None:
+        raise LookupError("bot_totals is empty - run sql/stats_rollup.sql")
+    day = today_stats.data[0] if today_stats.data else {}
+    return {
+        "total_users": totals.data[0]["users"],
+        "total_transactions": totals.data[0]["transactions"],
+        "today_transactions": day.get("transactions", 0),
+        "today_active_users": day.get("active_users", 0),
+        "today_new_users": day.get("new_users", 0),
+        "active_loans": totals.data[0]["active_loans"],
+    }
+
+async def get_counted_stats(today: date) -> Dict:
+    """Fallback when the rollup tables are missing: exact counts computed by the database"""
+    users, transactions, today_count, loan_count = await asyncio.gather(
+        count_rows(db.client.table("users").select("id", count="exact")),
+        count_rows(db.client.table("transactions").select("id", count="exact")),
+        count_rows(db.client.table("transactions").select("id", count="exact").gte("date", today.isoformat())),
+        count_rows(db.client.table("loans").select("id", count="exact").eq("status", "pending"))
+    )
+    return {
+        "total_users": users,
+        "total_transactions": transactions,
+        "today_transactions": today_count,
+        "active_loans": loan_count,
+    }
+
+async def get_bot_stats():
     """Get bot statistics"""
+    today = datetime.now().date()
     try:
-        # Total users
-        users = db.client.table("users").select("count").execute()
-        total_users = len(users.data) if users.data else 0
-        
-        # Total transactions
-        transactions = db.client.table("transactions").select("count").execute()
-        total_transactions = len(transactions.data) if transactions.data else 0
-        
-        # Today's transactions
-        today = datetime.now().date()
-        today_trans = db.client.table("transactions")\
-            .select("*")\
-            .gte("date", today.isoformat())\
-            .execute()
-        today_count = len(today_trans.data) if today_trans.data else 0
-        
-        # Active loans
-        active_loans = db.client.table("loans")\
-            .select("count")\
-            .eq("status", "pending")\
-            .execute()
-        loan_count = len(active_loans.data) if active_loans.data else 0
-        
-        return {
-            "total_users": total_users,
-            "total_transactions": total_transactions,
-            "today_transactions": today_count,
-            "active_loans": loan_count,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        try:
+            stats = await get_rollup_stats(today)
+        except (APIError, LookupError) as e:
+            print(f"⚠️  Rollup tables unavailable ({e}), counting rows instead")
+            stats = await get_counted_stats(today)
+        stats["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return stats
     except Exception as e:
         return {"error": str(e)}
 
-def display_stats():
+async def get_trends(days: int = 7) -> List[Dict]:
+    """Daily rollup rows for the last `days` days, oldest first (empty without rollups)"""
+    since = datetime.now().date() - timedelta(days=days - 1)
+    try:
+        response = await db.execute(
+            db.client.table("daily_summary")
+            .select("*")
+            .gte("day", since.isoformat())
+            .order("day")
+        )
+    except APIError:
+        return []
+    return response.data
+
+async def display_stats():
     """Display statistics in console"""
     print("\n" + "="*50)
     print("📊 CALCO AI BOT STATISTICS")
     print("="*50)
     
-    stats = get_bot_stats()
+    stats = await get_bot_stats()
     
     if "error" in stats:
         print(f"❌ Error: {stats['error']}")
@@ -57,11 +87,21 @@ def display_stats():
     print(f"\n👥 Total Users: {stats['total_users']}")
     print(f"💰 Total Transactions: {stats['total_transactions']}")
     print(f"📅 Today's Transactions: {stats['today_transactions']}")
+    if "today_active_users" in stats:
+        print(f"🙋 Active Today: {stats['today_active_users']} (new: {stats['today_new_users']})")
     print(f"💸 Active Loans: {stats['active_loans']}")
+    
+    trends = await get_trends()
+    if trends:
+        print("\n📈 Last 7 days:")
+        print(f"   {'day':<12}{'new users':>10}{'active':>8}{'trans.':>8}{'loans':>7}")
+        for row in trends:
+            print(f"   {row['day']:<12}{row['new_users']:>10}{row['active_users']:>8}"
+                  f"{row['transactions']:>8}{row['active_loans']:>7}")
     print(f"\n🕐 Last Updated: {stats['timestamp']}")
     print("="*50 + "\n")
 
-def monitor_loop(interval: int = 60):
+async def monitor_loop(interval: int = 60):
     """Monitor bot in real-time"""
     print("🔍 Starting Calco AI Monitor...")
     print(f"📊 Updating every {interval} seconds")
@@ -69,10 +109,10 @@ def monitor_loop(interval: int = 60):
     
     try:
         while True:
-            display_stats()
-            time.sleep(interval)
-    except KeyboardInterrupt:
-        print("\n\n👋 Monitor stopped")
+            await display_stats()
+            await asyncio.sleep(interval)
+    finally:
+        await db.close()
 
 if __name__ == "__main__":
     import sys
@@ -80,7 +120,10 @@ if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "loop":
         # Continuous monitoring
         interval = int(sys.argv[2]) if len(sys.argv) > 2 else 60
-        monitor_loop(interval)
+        try:
+            asyncio.run(monitor_loop(interval))
+        except KeyboardInterrupt:
+            print("\n\n👋 Monitor stopped")
     else:
         # Single check
-        display_stats()
+        asyncio.run(display_stats())
@@ -0,0 +1,209 @@
+"""
+Minimal Ogg Opus reader/writer for splitting voice messages
+Telegram voice notes are Ogg Opus; long ones are cut into shorter, standalone
+Ogg files on quiet stretches so they can be recognized in parallel.
+No audio is decoded - silence is detected from Opus packet sizes.
+"""
+import struct
+from typing import List, Tuple
+
+SAMPLE_RATE = 48000  # Opus granule positions always count 48 kHz samples
+PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+
+# Frame length in 48 kHz samples for each Opus TOC config (RFC 6716, section 3.1)
+FRAME_SAMPLES = (
+    [480, 960, 1920, 2880] * 3  # SILK-only: 10, 20, 40, 60 ms
+    + [480, 960] * 2            # Hybrid: 10, 20 ms
+    + [120, 240, 480, 960] * 4  # CELT-only: 2.5, 5, 10, 20 ms
+)
+
+def _crc_table() -> List[int]:
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+CRC_TABLE = _crc_table()
+
+def ogg_crc(data: bytes) -> int:
+    """Ogg page checksum (CRC-32, polynomial 0x04C11DB7, no reflection)"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ CRC_TABLE[(crc >> 24) ^ byte]
+    return crc
+
+def read_packets(data: bytes) -> Tuple[int, List[bytes]]:
+    """
+    Extract the Opus packets of the first logical stream
+
+    Returns:
+        (serial number, packets) - packets[0] is OpusHead, packets[1] OpusTags
+
+    Raises:
+        ValueError: if the data is not a well-formed Ogg Opus stream
+    """
+    packets = []
+    partial = b""
+    serial = None
+    offset = 0
+
+    while offset < len(data):
+        if len(data) - offset < PAGE_HEADER.size:
+            raise ValueError("Truncated Ogg page header")
+        magic, version, _, _, page_serial, _, _, segment_count = PAGE_HEADER.unpack_from(data, offset)
+        if magic != b"OggS" or version != 0:
+            raise ValueError("Not an Ogg stream")
+
+        lacing_start = offset + PAGE_HEADER.size
+        lacing = data[lacing_start:lacing_start + segment_count]
+        body = lacing_start + segment_count
+        offset = body + sum(lacing)
+        if len(lacing) != segment_count or offset > len(data):
+            raise ValueError("Truncated Ogg page")
+
+        if serial is None:
+            serial = page_serial
+        elif page_serial != serial:
+            continue  # Voice notes carry a single stream; ignore anything else
+
+        position = body
+        for size in lacing:
+            partial += data[position:position + size]
+            position += size
+            if size < 255:
+                packets.append(partial)
+                partial = b""
+
+    if len(packets) < 2 or not packets[0].startswith(b"OpusHead"):
+        raise ValueError("Not an Opus stream")
+    return serial, packets
+
+def packet_samples(packet: bytes) -> int:
+    """Duration of one Opus packet in 48 kHz samples"""
+    if not packet:
+        return 0
+    toc = packet[0]
+    frames = toc & 0x03
+    if frames == 3:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    elif frames != 0:
+        frames = 2
+    else:
+        frames = 1
+    return FRAME_SAMPLES[toc >> 3] * frames
+
+def write_stream(serial: int, head: bytes, tags: bytes, packets: List[bytes]) -> bytes:
+    """Build a standalone Ogg Opus file from header and audio packets"""
+    pre_skip = struct.unpack_from("<H", head, 10)[0]
+    pages = [
+        (0x02, 0, [head]),  # beginning of stream
+        (0x00, 0, [tags]),
+    ]
+
+    granule = pre_skip
+    page_packets, page_segments = [], 0
+    for packet in packets:
+        segments = len(packet) // 255 + 1
+        if page_packets and page_segments + segments > 255:
+            pages.append((0x00, granule, page_packets))
+            page_packets, page_segments = [], 0
+        page_packets.append(packet)
+        page_segments += segments
+        granule += packet_samples(packet)
+    if page_packets:
+        pages.append((0x00, granule, page_packets))
+
+    header_type, last_granule, last_packets = pages[-1]
+    pages[-1] = (header_type | 0x04, last_granule, last_packets)  # end of stream
+
+    out = bytearray()
+    for sequence, (header_type, page_granule, page_packets) in enumerate(pages):
+        lacing = bytearray()
+        for packet in page_packets:
+            lacing += b"\xff" * (len(packet) // 255) + bytes([len(packet) % 255])
+        page = bytearray(PAGE_HEADER.pack(
+            b"OggS", 0, header_type, page_granule, serial, sequence, 0, len(lacing)
+        ))
+        page += lacing
+        page += b"".join(page_packets)
+        struct.pack_into("<I", page, 22, ogg_crc(page))
+        out += page
+    return bytes(out)
+
+def duration(data: bytes) -> float:
+    """
+    Length of an Ogg Opus stream in seconds, read from the last page's granule
+    position without walking the stream; 0.0 if the data doesn't look like Ogg Opus
+    """
+    last_page = data.rfind(b"OggS")
+    if not data.startswith(b"OggS") or last_page < 0 or len(data) < last_page + PAGE_HEADER.size:
+        return 0.0
+    head = PAGE_HEADER.size + data[PAGE_HEADER.size - 1]
+    if data[head:head + 8] != b"OpusHead" or len(data) < head + 12:
+        return 0.0
+    pre_skip = struct.unpack_from("<H", data, head + 10)[0]
+    granule = struct.unpack_from("<q", data, last_page + 6)[0]
+    return max(0, granule - pre_skip) / SAMPLE_RATE
+
+def _quiet_flags(packets: List[bytes]) -> List[bool]:
+    """Mark packets much smaller than typical speech packets (silence / DTX)"""
+    sizes = sorted(len(p) for p in packets)
+    median = sizes[len(sizes) // 2]
+    limit = max(3, median * 0.35)
+    return [len(p) <= limit for p in packets]
+
+def split_on_silence(data: bytes, max_seconds: float, min_seconds: float = None) -> List[bytes]:
+    """
+    Split a voice note into standalone Ogg Opus segments no longer than max_seconds
+
+    Each cut is placed in the middle of the longest quiet stretch between
+    min_seconds (default half of max_seconds) and max_seconds into the segment;
+    without one the segment is cut at max_seconds.
+    Short or unparseable audio is returned unchanged as a single segment.
+    """
+    try:
+        serial, packets = read_packets(data)
+    except (ValueError, struct.error):
+        return [data]
+
+    head, tags, audio = packets[0], packets[1], packets[2:]
+    durations = [packet_samples(p) for p in audio]
+    if not audio or sum(durations) <= max_seconds * SAMPLE_RATE:
+        return [data]
+
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    min_samples = int((min_seconds if min_seconds is not None else max_seconds / 2) * SAMPLE_RATE)
+    quiet = _quiet_flags(audio)
+
+    cuts = []
+    start = 0
+    while True:
+        # Packets that fit in this segment, and the quiet runs between min and max length
+        elapsed, end = 0, start
+        best_run, run_start = None, None
+        while end < len(audio) and elapsed + durations[end] <= max_samples:
+            elapsed += durations[end]
+            end += 1
+            if quiet[end - 1] and elapsed >= min_samples:
+                if run_start is None:
+                    run_start = end - 1
+                if best_run is None or end - run_start >= best_run[1] - best_run[0]:
+                    best_run = (run_start, end)
+            else:
+                run_start = None
+
+        if end >= len(audio):
+            break
+        cut = (best_run[0] + best_run[1]) // 2 if best_run else end
+        cut = max(cut, start + 1)
+        cuts.append(cut)
+        start = cut
+
+    bounds = [0] + cuts + [len(audio)]
+    return [
+        write_stream(serial, head, tags, audio[a:b])
+        for a, b in zip(bounds, bounds[1:])
+    ]
@@ -0,0 +1,168 @@
+"""
+Central scheduler for OpenAI requests
+Requests wait in a priority queue and are released only while the
+requests-per-minute and tokens-per-minute buckets allow, so bursts queue up at
+the account's limit instead of failing with 429. Rate-limited and transient
+failures are retried with jittered exponential backoff, honoring Retry-After.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+import openai
+from typing import Optional
+
+# Lower runs first
+PRIORITY_TEXT = 0        # user typed a message and is waiting
+PRIORITY_VOICE = 1       # voice notes already take seconds to process
+
+MAX_BACKOFF = 20  # seconds
+COMPLETION_TOKENS_ESTIMATE = 300  # reserved per chat request until usage is known
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """per_minute: refill rate and capacity; 0 disables the limit"""
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (0 if it can be taken now)"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        # Requests larger than the whole bucket go through once it is full
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        if self.rate:
+            self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float):
+        """Correct an earlier estimate once actual usage is known"""
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Rough token count of a chat request: ~4 characters per token plus the reply"""
+    chars = sum(len(message.get("content") or "") for message in kwargs.get("messages", []))
+    return chars // 4 + kwargs.get("max_tokens", COMPLETION_TOKENS_ESTIMATE)
+
+def retry_after(error: openai.APIStatusError) -> Optional[float]:
+    """Delay requested by the server in retry-after-ms / Retry-After headers"""
+    headers = error.response.headers
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, ValueError):
+            continue  # missing, or HTTP-date form
+    return None
+
+class OpenAIScheduler:
+    def __init__(self, max_concurrency: int, requests_per_minute: float,
+                 tokens_per_minute: float, max_retries: int):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+        # (priority, sequence, tokens, future) - sequence keeps FIFO order within a priority
+        self.queue = []
+        self.sequence = itertools.count()
+        self.active = 0
+        self.paused_until = 0.0  # set by a 429 so queued requests wait too
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+
+    async def run(self, method, priority: int = PRIORITY_TEXT, tokens: int = 0, **kwargs):
+        """
+        Call method(**kwargs) once the limits allow, retrying rate limits and
+        transient errors
+
+        Args:
+            priority: PRIORITY_TEXT or PRIORITY_VOICE
+            tokens: estimated tokens the request will use (0 for non-chat endpoints)
+        """
+        sequence = next(self.sequence)  # retries keep their place in the queue
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, sequence, tokens)
+            try:
+                response = await method(**kwargs)
+            except openai.RateLimitError as e:
+                if attempt == self.max_retries or e.code == "insufficient_quota":
+                    raise
+                delay = self._backoff(attempt, retry_after(e))
+                # The limit is per account, so everyone waits
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                print(f"⚠️  OpenAI rate limit hit, retrying in {delay:.1f}s")
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"⚠️  OpenAI request failed ({e!r}), retrying in {delay:.1f}s")
+            else:
+                usage = getattr(response, "usage", None)
+                if tokens and usage is not None:
+                    self.tokens.adjust(usage.total_tokens - tokens)
+                return response
+            finally:
+                self._release()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+        return min(1 * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1)
+
+    async def _acquire(self, priority: int, sequence: int, tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, sequence, tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # granted just as the caller gave up
+            raise
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant slots to queued requests in priority order while the limits allow"""
+        while self.queue and self.active < self.max_concurrency:
+            _, _, tokens, future = self.queue[0]
+            if future.done():
+                heapq.heappop(self.queue)  # caller cancelled
+                continue
+
+            wait = max(
+                self.paused_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens)
+            )
+            if wait > 0:
+                # Lower-priority requests don't jump ahead of one waiting for budget
+                if self.wakeup is None:
+                    self.wakeup = asyncio.get_running_loop().call_later(wait, self._wake)
+                return
+
+            heapq.heappop(self.queue)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.active += 1
+            future.set_result(None)
+
+    def _wake(self):
+        self.wakeup = None
+        self._dispatch()
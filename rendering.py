@@ -0,0 +1,111 @@
+"""
+Keyboards and message bodies for the bot
+Keyboards that don't depend on the user are built once per language at import
+and shared by every update - treat them as read-only. Message bodies are
+assembled from part lists with a single join.
+"""
+from typing import List, Optional
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from translations import TRANSLATIONS, t
+
+CHOOSE_LANGUAGE_TEXT = "🌐 Tilni tanlang / Выберите язык / Choose language:"
+
+def _markup(rows: List[List[tuple]], lang: Optional[str] = None) -> InlineKeyboardMarkup:
+    """rows of (translation key or label, callback data); keys are translated when lang is given"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(t(label, lang) if lang else label, callback_data=data) for label, data in row]
+        for row in rows
+    ])
+
+MAIN_MENU_ROWS = [
+    [("add_expense", "add_expense"), ("add_income", "add_income")],
+    [("view_history", "view_history"), ("monthly_report", "monthly_report")],
+    [("manage_loans", "manage_loans"), ("settings", "settings")],
+]
+LOAN_MENU_ROWS = [
+    [("add_loan", "add_loan"), ("view_loans", "view_loans")],
+    [("back", "main_menu")],
+]
+SETTINGS_ROWS = [
+    [("change_language", "change_language")],
+    [("change_currency", "change_currency")],
+    [("back", "main_menu")],
+]
+
+LANGUAGE_KEYBOARD = _markup([
+    [("🇺🇿 O'zbek", "lang_uz"), ("🇷🇺 Русский", "lang_ru")],
+    [("🇬🇧 English", "lang_en")],
+])
+CURRENCY_KEYBOARD = _markup([
+    [("🇺🇿 UZS (So'm)", "currency_UZS"), ("🇺🇸 USD (Dollar)", "currency_USD")],
+    [("🇷🇺 RUB (Ruble)", "currency_RUB")],
+])
+
+MAIN_MENU_KEYBOARDS = {lang: _markup(MAIN_MENU_ROWS, lang) for lang in TRANSLATIONS}
+LOAN_MENU_KEYBOARDS = {lang: _markup(LOAN_MENU_ROWS, lang) for lang in TRANSLATIONS}
+SETTINGS_KEYBOARDS = {lang: _markup(SETTINGS_ROWS, lang) for lang in TRANSLATIONS}
+BACK_KEYBOARDS = {lang: _markup([[("back", "main_menu")]], lang) for lang in TRANSLATIONS}
+LOANS_BACK_KEYBOARDS = {lang: _markup([[("back", "manage_loans")]], lang) for lang in TRANSLATIONS}
+
+def get_language_keyboard() -> InlineKeyboardMarkup:
+    return LANGUAGE_KEYBOARD
+
+def get_currency_keyboard() -> InlineKeyboardMarkup:
+    return CURRENCY_KEYBOARD
+
+def get_main_menu_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return MAIN_MENU_KEYBOARDS.get(lang) or MAIN_MENU_KEYBOARDS["uz"]
+
+def get_loan_menu_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return LOAN_MENU_KEYBOARDS.get(lang) or LOAN_MENU_KEYBOARDS["uz"]
+
+def get_settings_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return SETTINGS_KEYBOARDS.get(lang) or SETTINGS_KEYBOARDS["uz"]
+
+def get_back_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return BACK_KEYBOARDS.get(lang) or BACK_KEYBOARDS["uz"]
+
+def get_loans_back_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return LOANS_BACK_KEYBOARDS.get(lang) or LOANS_BACK_KEYBOARDS["uz"]
+
+# Message bodies
+
+def format_transaction_summary(transactions: list, lang: str, user_currency: str) -> str:
+    """Format multiple transactions summary with proper language and currency"""
+    parts = [t("transactions_added", lang, count=len(transactions)), "\n\n"]
+    total_amount = 0
+    for i, trans in enumerate(transactions, 1):
+        total_amount += trans["amount"]
+        emoji = "💰" if trans["type"] == "income" else "💸"
+        parts.append(
+            f"{i}. {emoji} {trans['amount']} {user_currency} - {trans['category']}\n"
+            f"   📝 {trans['description']}\n\n"
+        )
+    parts.append(t("transactions_total", lang, total=total_amount, currency=user_currency))
+    return "".join(parts)
+
+def format_history(transactions: list, title: str, user_currency: str) -> str:
+    """History page: numbered transactions under a title"""
+    parts = [title, "\n\n"]
+    for i, trans in enumerate(transactions, 1):
+        emoji = "💰" if trans["type"] == "income" else "💸"
+        parts.append(
+            f"{i}. {emoji} {trans['amount']} {user_currency} - {trans['category']}\n"
+            f"   📝 {trans['description']}\n"
+            f"   📅 {trans['date']}\n\n"
+        )
+    return "".join(parts)
+
+def format_loans(loans: list, lang: str) -> str:
+    parts = [t("loans_list", lang)]
+    for loan in loans:
+        status_emoji = "⏳" if loan["status"] == "pending" else "✅"
+        parts.append(t("loan_item", lang,
+                       person=loan["person_name"],
+                       amount=loan["amount"],
+                       date=loan["given_date"],
+                       status=f"{status_emoji} {loan['status']}"))
+    return "".join(parts)
+
+def format_settings(lang: str, currency: str) -> str:
+    return t("settings_text", lang, language=lang.upper(), currency=currency)
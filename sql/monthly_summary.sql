@@ -0,0 +1,50 @@
+-- Monthly report totals computed in the database.
+-- Run once in the Supabase SQL Editor; the bot calls it through RPC.
+
+create index if not exists transactions_user_date_idx
+    on transactions (user_id, date);
+
+drop function if exists monthly_summary(bigint, date, date);
+
+-- Returns a single row; PostgREST responses must be row sets
+create or replace function monthly_summary(p_user_id bigint, p_start date, p_end date)
+returns table (
+    income numeric,
+    expense numeric,
+    income_count bigint,
+    expense_count bigint,
+    count bigint,
+    categories json
+)
+language sql
+stable
+as $$
+    with month as (
+        select type, category, amount
+        from transactions
+        where user_id = p_user_id
+          and date >= p_start
+          and date < p_end
+    ),
+    by_category as (
+        select type, category, sum(amount) as total, count(*) as count
+        from month
+        group by type, category
+    )
+    select
+        coalesce(sum(amount) filter (where type = 'income'), 0),
+        coalesce(sum(amount) filter (where type = 'expense'), 0),
+        count(*) filter (where type = 'income'),
+        count(*) filter (where type = 'expense'),
+        count(*),
+        (
+            select coalesce(json_agg(json_build_object(
+                'type', b.type,
+                'category', b.category,
+                'total', b.total,
+                'count', b.count
+            ) order by b.total desc), '[]'::json)
+            from by_category b
+        )
+    from month;
+$$;
@@ -0,0 +1,177 @@
+-- Bot-wide counters kept up to date by triggers, read by monitor.py.
+-- Run once in the Supabase SQL Editor (safe to re-run: the rollups are rebuilt).
+-- Counters are sharded by user: each change touches one of 16 rows picked by
+-- user id, so concurrent inserts from different users don't queue on one row.
+-- Readers use the bot_totals_summary and daily_summary views, which add the shards up.
+
+begin;
+
+-- Older layouts (one bot_totals row, one daily_stats row per day) are replaced;
+-- everything except past loan changes is recomputed below
+drop view if exists bot_totals_summary;
+drop view if exists daily_summary;
+drop table if exists bot_totals;
+drop table if exists daily_stats;
+
+create or replace function stats_shard(user_id bigint) returns smallint
+language sql immutable as $$
+    select (abs(user_id) % 16)::smallint
+$$;
+
+create table bot_totals (
+    shard smallint primary key,
+    users bigint not null default 0,
+    transactions bigint not null default 0,
+    active_loans bigint not null default 0
+);
+
+insert into bot_totals (shard) select generate_series(0, 15);
+
+create table daily_stats (
+    day date not null,
+    shard smallint not null,
+    new_users integer not null default 0,
+    active_users integer not null default 0,
+    transactions integer not null default 0,
+    loan_changes integer not null default 0,  -- net change in pending loans
+    primary key (day, shard)
+);
+
+-- Who logged a transaction on a given day, so active_users counts each user once
+-- (deleting a transaction later doesn't lower active_users)
+create table if not exists daily_active_users (
+    day date not null,
+    user_id bigint not null,
+    primary key (day, user_id)
+);
+
+create view bot_totals_summary as
+select sum(users) as users,
+       sum(transactions) as transactions,
+       sum(active_loans) as active_loans
+from bot_totals;
+
+-- active_loans is the number of pending loans at the end of each day
+create view daily_summary as
+select day, new_users, active_users, transactions,
+       (select sum(active_loans) from bot_totals)
+         - coalesce(sum(loan_changes) over (order by day desc rows between unbounded preceding and 1 preceding), 0)
+         as active_loans
+from (
+    select day,
+           sum(new_users) as new_users,
+           sum(active_users) as active_users,
+           sum(transactions) as transactions,
+           sum(loan_changes) as loan_changes
+    from daily_stats
+    group by day
+) days;
+
+-- Users
+
+create or replace function stats_users_changed() returns trigger
+language plpgsql as $$
+begin
+    if tg_op = 'INSERT' then
+        update bot_totals set users = users + 1 where shard = stats_shard(new.telegram_id);
+        insert into daily_stats (day, shard, new_users) values (current_date, stats_shard(new.telegram_id), 1)
+        on conflict (day, shard) do update set new_users = daily_stats.new_users + 1;
+    else
+        update bot_totals set users = users - 1 where shard = stats_shard(old.telegram_id);
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists stats_users on users;
+create trigger stats_users after insert or delete on users
+for each row execute function stats_users_changed();
+
+-- Transactions (counted on the day they are dated)
+
+create or replace function stats_transactions_changed() returns trigger
+language plpgsql as $$
+declare
+    added integer;
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        update daily_stats set transactions = transactions - 1
+        where day = old.date::date and shard = stats_shard(old.user_id);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        insert into daily_active_users (day, user_id) values (new.date::date, new.user_id)
+        on conflict do nothing;
+        get diagnostics added = row_count;
+        insert into daily_stats (day, shard, transactions, active_users)
+        values (new.date::date, stats_shard(new.user_id), 1, added)
+        on conflict (day, shard) do update set
+            transactions = daily_stats.transactions + 1,
+            active_users = daily_stats.active_users + excluded.active_users;
+    end if;
+    if tg_op = 'INSERT' then
+        update bot_totals set transactions = transactions + 1 where shard = stats_shard(new.user_id);
+    elsif tg_op = 'DELETE' then
+        update bot_totals set transactions = transactions - 1 where shard = stats_shard(old.user_id);
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists stats_transactions on transactions;
+create trigger stats_transactions after insert or delete or update of date on transactions
+for each row execute function stats_transactions_changed();
+
+-- Loans
+
+create or replace function stats_loans_changed() returns trigger
+language plpgsql as $$
+declare
+    delta integer := 0;
+    loan_user bigint := coalesce(new.user_id, old.user_id);
+begin
+    if tg_op in ('INSERT', 'UPDATE') and new.status = 'pending' then
+        delta := delta + 1;
+    end if;
+    if tg_op in ('DELETE', 'UPDATE') and old.status = 'pending' then
+        delta := delta - 1;
+    end if;
+    if delta <> 0 then
+        update bot_totals set active_loans = active_loans + delta where shard = stats_shard(loan_user);
+        insert into daily_stats (day, shard, loan_changes) values (current_date, stats_shard(loan_user), delta)
+        on conflict (day, shard) do update set loan_changes = daily_stats.loan_changes + delta;
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists stats_loans on loans;
+create trigger stats_loans after insert or delete or update of status on loans
+for each row execute function stats_loans_changed();
+
+-- Backfill from existing rows
+
+update bot_totals set users = counted.users
+from (select stats_shard(telegram_id) as shard, count(*) as users from users group by 1) counted
+where bot_totals.shard = counted.shard;
+
+update bot_totals set transactions = counted.transactions
+from (select stats_shard(user_id) as shard, count(*) as transactions from transactions group by 1) counted
+where bot_totals.shard = counted.shard;
+
+update bot_totals set active_loans = counted.active_loans
+from (select stats_shard(user_id) as shard, count(*) as active_loans from loans where status = 'pending' group by 1) counted
+where bot_totals.shard = counted.shard;
+
+insert into daily_active_users (day, user_id)
+select distinct date::date, user_id from transactions
+on conflict do nothing;
+
+insert into daily_stats (day, shard, transactions, active_users)
+select date::date, stats_shard(user_id), count(*), count(distinct user_id)
+from transactions
+group by 1, 2;
+
+insert into daily_stats (day, shard, new_users)
+select created_at::date, stats_shard(telegram_id), count(*)
+from users
+group by 1, 2
+on conflict (day, shard) do update set new_users = excluded.new_users;
+
+commit;
@@ -0,0 +1,7 @@
+-- Index for keyset-paginated history (Database.get_transactions).
+-- Run once in the Supabase SQL Editor. Pages are read with
+-- "(date, id) < cursor order by date desc, id desc", which this index serves
+-- directly without scanning the rows of earlier pages.
+
+create index if not exists transactions_user_date_id_idx
+    on transactions (user_id, date desc, id desc);
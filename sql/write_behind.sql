@@ -0,0 +1,10 @@
+-- Idempotency keys for write-behind inserts (WRITE_BEHIND_FILE, write_behind.py).
+-- Run once in the Supabase SQL Editor before enabling write-behind.
+-- Journaled rows are sent as upserts on this key that ignore existing rows, so
+-- a batch replayed after a crash or a lost response is stored once.
+-- Rows inserted directly keep a null key; the unique index allows any number of nulls.
+
+alter table transactions add column if not exists idempotency_key uuid;
+
+create unique index if not exists transactions_idempotency_key_idx
+    on transactions (idempotency_key);
@@ -0,0 +1,115 @@
+"""
+Conversation state storage for Calco AI
+Keeps per-user flow state (selected language, pending action) with automatic expiry
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from cache import TTLCache
+from config import STATE_BACKEND, STATE_DB_PATH, STATE_TTL, STATE_MAX_USERS
+
+class StateStore(ABC):
+    """Interface for per-user conversation state"""
+
+    @abstractmethod
+    async def get(self, user_id: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def set(self, user_id: int, state: Dict):
+        ...
+
+    @abstractmethod
+    async def pop(self, user_id: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        ...
+
+class MemoryStateStore(StateStore):
+    def __init__(self, maxsize: int = STATE_MAX_USERS, ttl: float = STATE_TTL):
+        """Bounded in-process store; least recently used and stale flows are dropped"""
+        self.states = TTLCache(maxsize, ttl)
+
+    async def get(self, user_id: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        return self.states.get(user_id, default)
+
+    async def set(self, user_id: int, state: Dict):
+        self.states.set(user_id, state)
+
+    async def pop(self, user_id: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        return self.states.pop(user_id, default)
+
+class SQLiteStateStore(StateStore):
+    # Expired rows are purged after this many writes
+    PURGE_EVERY = 100
+
+    def __init__(self, path: str = STATE_DB_PATH, ttl: float = STATE_TTL):
+        """
+        Store shared by several processes on the same host
+
+        Args:
+            path: SQLite database file (opened in WAL mode)
+            ttl: Seconds after the last update before a flow expires
+        """
+        self.ttl = ttl
+        self.writes = 0
+        # Queries can wait up to 5 s on another process's lock, so they run off the
+        # event loop; one thread keeps the connection's statements in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_states ("
+            "user_id INTEGER PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.purge_expired()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def get(self, user_id: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        state = await self._run(self._get, user_id)
+        return state if state is not None else default
+
+    async def set(self, user_id: int, state: Dict):
+        await self._run(self._set, user_id, state)
+
+    async def pop(self, user_id: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        state = await self._run(self._pop, user_id)
+        return state if state is not None else default
+
+    def _get(self, user_id: int) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT state FROM user_states WHERE user_id = ? AND expires_at > ?",
+            (user_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, user_id: int, state: Dict):
+        self.conn.execute(
+            "INSERT INTO user_states (user_id, state, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at",
+            (user_id, json.dumps(state, ensure_ascii=False), time.time() + self.ttl)
+        )
+        self.writes += 1
+        if self.writes % self.PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def _pop(self, user_id: int) -> Optional[Dict]:
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            state = self._get(user_id)
+            self.conn.execute("DELETE FROM user_states WHERE user_id = ?", (user_id,))
+        return state
+
+    def purge_expired(self):
+        self.conn.execute("DELETE FROM user_states WHERE expires_at <= ?", (time.time(),))
+
+def create_state_store() -> StateStore:
+    """Build the store selected by STATE_BACKEND ("memory" or "sqlite")"""
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStateStore()
+    return MemoryStateStore()
@@ -0,0 +1,143 @@
+"""
+Multi-process supervisor for Calco AI
+Runs WORKER_COUNT bot processes plus one receiver process. The receiver is the
+only session that takes updates from Telegram; it forwards each update to the
+queue of the worker whose index the user's Telegram id hashes to (see
+dispatch.py), so one user's updates stay in order on one process. Crashed or
+unresponsive processes are restarted; a worker's queue outlives its process,
+so updates forwarded during a restart wait for it.
+
+Usage:
+    WORKER_COUNT=4 STATE_BACKEND=sqlite python supervisor.py
+"""
+import multiprocessing
+import os
+import signal
+import time
+
+CHECK_INTERVAL = 5  # seconds between health checks
+HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT") or "60")
+STARTUP_GRACE = 60  # seconds a new worker gets to connect before heartbeats are checked
+MAX_RESTART_DELAY = 60
+# Workers get JOB_DRAIN_TIMEOUT to finish queued messages after SIGTERM, plus time to flush and disconnect
+STOP_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT") or "30") + 15
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE") or "1000")  # forwarded updates waiting per worker
+
+def run_worker(index: int, count: int, updates, heartbeat):
+    """Worker process entry point"""
+    # config.py reads these on import, so set them before importing the bot
+    os.environ["WORKER_INDEX"] = str(index)
+    os.environ["WORKER_COUNT"] = str(count)
+
+    import bot
+    print(f"🤖 Worker {index + 1}/{count} is starting...")
+    bot.app.run(bot.serve(heartbeat, updates))
+
+def run_receiver(queues, heartbeat):
+    """Receiver process entry point"""
+    import asyncio
+    import dispatch
+    print(f"📡 Update receiver is starting ({len(queues)} workers)...")
+    asyncio.run(dispatch.receive(queues, heartbeat))
+
+class Worker:
+    def __init__(self, context, name: str, target, args: tuple):
+        """A supervised process; target(*args, heartbeat) must keep heartbeat updated"""
+        self.context = context
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.heartbeat = context.Value("d", 0.0)
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_at = None
+
+    def start(self):
+        self.restart_at = None
+        self.heartbeat.value = 0.0
+        self.started_at = time.time()
+        self.process = self.context.Process(
+            target=self.target,
+            args=self.args + (self.heartbeat,),
+            name=f"calco-{self.name}"
+        )
+        self.process.start()
+
+    def terminate(self):
+        """Ask the process to shut down (SIGTERM) without waiting"""
+        if self.process and self.process.is_alive():
+            self.process.terminate()
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        if self.process and self.process.is_alive():
+            self.terminate()
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+
+    def health(self) -> str:
+        """"ok", "dead" or "stalled" """
+        if not self.process.is_alive():
+            return "dead"
+        last_beat = self.heartbeat.value or self.started_at + STARTUP_GRACE
+        if time.time() - last_beat > HEARTBEAT_TIMEOUT:
+            return "stalled"
+        return "ok"
+
+    def schedule_restart(self):
+        """Stop the worker and start it again after an exponential backoff"""
+        self.stop()
+        self.restart_at = time.time() + min(2 ** self.restarts, MAX_RESTART_DELAY)
+        self.restarts += 1
+
+def supervise(count: int):
+    context = multiprocessing.get_context("spawn")
+    # A single worker takes its updates from Telegram itself
+    queues = [context.Queue(UPDATE_QUEUE_SIZE) for _ in range(count)] if count > 1 else [None]
+    workers = [Worker(context, f"worker-{i}", run_worker, (i, count, queues[i])) for i in range(count)]
+    if count > 1:
+        # Started last so workers are connecting by the time updates arrive
+        workers.append(Worker(context, "receiver", run_receiver, (queues,)))
+    running = True
+
+    def shutdown(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"🚀 Starting {count} Calco AI workers...")
+    for worker in workers:
+        worker.start()
+
+    try:
+        while running:
+            time.sleep(CHECK_INTERVAL)
+            for worker in workers:
+                if worker.restart_at is not None:
+                    if time.time() >= worker.restart_at:
+                        worker.start()
+                    continue
+
+                status = worker.health()
+                if status == "ok":
+                    # A worker that stayed healthy for a while starts its backoff over
+                    if worker.restarts and time.time() - worker.started_at > MAX_RESTART_DELAY * 2:
+                        worker.restarts = 0
+                    continue
+
+                print(f"⚠️  {worker.name} is {status} (exit code {worker.process.exitcode}), restarting...")
+                worker.schedule_restart()
+    finally:
+        print("🛑 Stopping workers...")
+        # The receiver (last) stops first, then workers drain their jobs in parallel
+        for worker in reversed(workers):
+            worker.terminate()
+        for worker in reversed(workers):
+            worker.stop()
+
+if __name__ == "__main__":
+    supervise(int(os.getenv("WORKER_COUNT") or os.cpu_count() or 1))
@@ -13,11 +13,11 @@ def test_config():
     assert SUPABASE_URL, "❌ SUPABASE_URL not set"
     print("✅ Configuration OK")
 
-def test_database():
+async def test_database():
     print("\n🔍 Testing database connection...")
     try:
         # Try to query users table
-        result = db.client.table("users").select("count").execute()
+        result = await db.execute(db.client.table("users").select("count"))
         print("✅ Database connection OK")
     except Exception as e:
         print(f"❌ Database error: {e}")
@@ -28,7 +28,7 @@ def test_ai_parser():
     print("\n🔍 Testing AI parser...")
     try:
         # Test transaction parsing
-        result = ai_parser.parse_transaction("I spent 15000 on food", "uz")
+        result = asyncio.run(ai_parser.parse_transaction("I spent 15000 on food", "uz"))
         if result and "amount" in result:
             print(f"✅ AI parser OK - Parsed: {result}")
         else:
@@ -42,7 +42,7 @@ def main():
     
     test_config()
     
-    if test_database():
+    if asyncio.run(test_database()):
         print("\n✅ Database is ready!")
     else:
         print("\n⚠️  Please run schema.sql in Supabase first")
@@ -0,0 +1,41 @@
+"""
+Unit tests for routing updates to workers in multi-process mode
+
+Run with: python -m unittest discover tests
+"""
+import unittest
+
+from pyrogram import raw
+from dispatch import update_user_id, worker_for, encode, decode
+
+def private_message(user_id: int, text: str):
+    return raw.types.UpdateNewMessage(
+        message=raw.types.Message(
+            id=1, peer_id=raw.types.PeerUser(user_id=user_id), date=0, message=text
+        ),
+        pts=1, pts_count=1
+    )
+
+class DispatchTest(unittest.TestCase):
+    def test_user_id(self):
+        self.assertEqual(update_user_id(private_message(42, "kofe 15000")), 42)
+        callback = raw.types.UpdateBotCallbackQuery(
+            query_id=1, user_id=7, peer=raw.types.PeerUser(user_id=7), msg_id=1, chat_instance=1
+        )
+        self.assertEqual(update_user_id(callback), 7)
+        self.assertIsNone(update_user_id(raw.types.UpdateConfig()))
+
+    def test_worker_for(self):
+        self.assertEqual(worker_for(None, 4), 0)
+        self.assertEqual({worker_for(42, 4) for _ in range(3)}, {worker_for(42, 4)})
+        self.assertEqual(len({worker_for(user_id, 4) for user_id in range(100)}), 4)
+
+    def test_round_trip(self):
+        user = raw.types.User(id=42, access_hash=123, first_name="Ali")
+        update, users, chats = decode(encode(private_message(42, "kofe 15000"), {42: user}, {}))
+        self.assertEqual(update.message.message, "kofe 15000")
+        self.assertEqual(users[42].access_hash, 123)
+        self.assertEqual(chats, {})
+
+if __name__ == "__main__":
+    unittest.main()
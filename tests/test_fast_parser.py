@@ -0,0 +1,66 @@
+"""
+Unit tests for the local rule-based parser
+
+Run with: python -m unittest discover tests
+"""
+import os
+import unittest
+
+# config.py refuses to import without these; nothing here talks to the services
+for name, value in {
+    "BOT_TOKEN": "123456:test",
+    "API_ID": "1",
+    "API_HASH": "test",
+    "OPENAI_API_KEY": "sk-test",
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_KEY": "test",
+    "RATE_SOURCE": "static",
+}.items():
+    os.environ.setdefault(name, value)
+
+from config import FAST_PARSE_THRESHOLD
+from fast_parser import fast_parser
+
+class CurrencyTest(unittest.TestCase):
+    def assert_parsed(self, text, amount, currency):
+        result, confidence = fast_parser.parse(text)
+        self.assertIsNotNone(result, text)
+        self.assertEqual(result["amount"], amount, text)
+        self.assertEqual(result["currency"], currency, text)
+        self.assertGreaterEqual(confidence, FAST_PARSE_THRESHOLD, text)
+
+    def assert_left_to_gpt(self, text):
+        _, confidence = fast_parser.parse(text)
+        self.assertLess(confidence, FAST_PARSE_THRESHOLD, text)
+
+    def test_russian_currency_words(self):
+        self.assert_parsed("50 евро аптека", 50, "EUR")
+        self.assert_parsed("500 рублей обед", 500, "RUB")
+        self.assert_parsed("100 долларов такси", 100, "USD")
+        self.assert_parsed("2000 тенге такси", 2000, "KZT")
+
+    def test_latin_and_symbols(self):
+        self.assert_parsed("5$ taxi", 5, "USD")
+        self.assert_parsed("20 euro lunch", 20, "EUR")
+        self.assert_parsed("3000 tenge taksi", 3000, "KZT")
+        self.assert_parsed("15000 so'm non", 15000, "UZS")
+
+    def test_no_currency_defaults_to_uzs(self):
+        self.assert_parsed("15000 non", 15000, "UZS")
+
+    def test_currency_inside_other_words_is_ignored(self):
+        self.assert_parsed("rubashka 200000 kiyim", 200000, "UZS")
+        self.assert_parsed("сумка 150000 магазин", 150000, "UZS")
+        self.assert_parsed("рубашка 90000 одежда", 90000, "UZS")
+
+    def test_unknown_or_mixed_currency_goes_to_gpt(self):
+        self.assert_left_to_gpt("20 фунтов такси")
+        self.assert_left_to_gpt("£20 taxi")
+        self.assert_left_to_gpt("20 $ € taxi")
+
+    def test_currency_word_not_in_description(self):
+        result, _ = fast_parser.parse("500 рублей обед")
+        self.assertEqual(result["description"], "обед")
+
+if __name__ == "__main__":
+    unittest.main()
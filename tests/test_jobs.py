@@ -0,0 +1,68 @@
+"""
+Unit tests for the background job queue
+
+Run with: python -m unittest discover tests
+"""
+import asyncio
+import unittest
+
+import benchmarks.fakes  # sets the environment config.py needs
+from ai_parser import ai_parser
+from jobs import JobQueue
+
+class JobQueueTest(unittest.TestCase):
+    def test_same_user_jobs_all_saved_in_order(self):
+        saved = []
+
+        async def save(user_id: int, text: str):
+            # Goes through the same per-user supersede guard as parsing does
+            async def parse():
+                await asyncio.sleep(0.01)
+                return text
+            saved.append(await ai_parser._run_for_user(user_id, parse()))
+
+        async def run():
+            jobs = JobQueue(4, 10)
+            await jobs.submit("save", save, 1, "kofe 15000", key=1)
+            await jobs.submit("save", save, 1, "taksi 20000", key=1)
+            await jobs.submit("save", save, 2, "non 5000", key=2)
+            await jobs.join()
+            await jobs.stop(1)
+
+        asyncio.run(run())
+        self.assertEqual([text for text in saved if text != "non 5000"], ["kofe 15000", "taksi 20000"])
+        self.assertIn("non 5000", saved)
+
+    def test_other_users_run_concurrently(self):
+        async def run() -> float:
+            jobs = JobQueue(2, 10)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await jobs.submit("sleep", asyncio.sleep, 0.1, key=1)
+            await jobs.submit("sleep", asyncio.sleep, 0.1, key=2)
+            await jobs.join()
+            await jobs.stop(1)
+            return loop.time() - start
+
+        self.assertLess(asyncio.run(run()), 0.19)
+
+    def test_dropped_jobs_get_on_drop(self):
+        dropped = []
+
+        async def run():
+            jobs = JobQueue(1, 10)
+            for i in range(3):
+                await jobs.submit("slow", asyncio.sleep, 10, key=1,
+                                  on_drop=lambda i=i: asyncio.sleep(0, dropped.append(i)))
+            await asyncio.sleep(0.01)
+            await jobs.stop(0.05)
+            # Submitted after shutdown: dropped at once instead of restarting workers
+            await jobs.submit("late", asyncio.sleep, 10, on_drop=lambda: asyncio.sleep(0, dropped.append("late")))
+            return jobs
+
+        jobs = asyncio.run(run())
+        self.assertEqual(sorted(dropped, key=str), [0, 1, 2, "late"])
+        self.assertEqual(jobs.workers, [])
+
+if __name__ == "__main__":
+    unittest.main()
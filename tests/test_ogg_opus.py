@@ -0,0 +1,97 @@
+"""
+Unit tests for the Ogg Opus reader/writer and silence splitting
+
+Run with: python -m unittest discover tests
+"""
+import struct
+import unittest
+
+from ogg_opus import (
+    SAMPLE_RATE, PAGE_HEADER, read_packets, write_stream, packet_samples, duration, ogg_crc,
+    split_on_silence
+)
+
+SERIAL = 1234
+PRE_SKIP = 312
+HEAD = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, PRE_SKIP, 48000, 0, 0)
+TAGS = b"OpusTags" + struct.pack("<I", 4) + b"test" + struct.pack("<I", 0)
+TOC_20MS = bytes([31 << 3])  # CELT-only, 20 ms, one frame
+
+def packet(size: int, fill: int = 0x55) -> bytes:
+    return TOC_20MS + bytes([fill]) * (size - 1)
+
+def pages(data: bytes) -> list:
+    """(header_type, segment_count, page bytes) of every page"""
+    result, offset = [], 0
+    while offset < len(data):
+        _, _, header_type, _, _, _, _, segment_count = PAGE_HEADER.unpack_from(data, offset)
+        lacing = data[offset + PAGE_HEADER.size:offset + PAGE_HEADER.size + segment_count]
+        end = offset + PAGE_HEADER.size + segment_count + sum(lacing)
+        result.append((header_type, segment_count, data[offset:end]))
+        offset = end
+    return result
+
+def voice(seconds: float, quiet_at=()) -> list:
+    """20 ms packets of 'speech' with 0.4 s of small (quiet) packets starting at each of quiet_at"""
+    packets = []
+    for i in range(int(seconds * 50)):
+        in_pause = any(start * 50 <= i < start * 50 + 20 for start in quiet_at)
+        packets.append(packet(3) if in_pause else packet(80, i % 251))
+    return packets
+
+class OggOpusTest(unittest.TestCase):
+    def test_round_trip_with_lacing(self):
+        # 255 and 510 bytes need a trailing 0 lacing value; 600 spans three segments
+        audio = [packet(10), packet(255), packet(254), packet(510), packet(600), packet(3)]
+        data = write_stream(SERIAL, HEAD, TAGS, audio)
+
+        serial, packets = read_packets(data)
+        self.assertEqual(serial, SERIAL)
+        self.assertEqual(packets, [HEAD, TAGS] + audio)
+
+        for _, _, page in pages(data):
+            unsigned = bytearray(page)
+            struct.pack_into("<I", unsigned, 22, 0)
+            self.assertEqual(struct.unpack_from("<I", page, 22)[0], ogg_crc(bytes(unsigned)))
+        self.assertAlmostEqual(duration(data), len(audio) * 0.02)
+
+    def test_many_packets_span_pages(self):
+        audio = voice(10)
+        data = write_stream(SERIAL, HEAD, TAGS, audio)
+        page_list = pages(data)
+        self.assertGreater(len(page_list), 3)
+        self.assertTrue(all(segments <= 255 for _, segments, _ in page_list))
+        self.assertEqual(page_list[0][0], 0x02)   # beginning of stream
+        self.assertEqual(page_list[-1][0], 0x04)  # end of stream
+        self.assertEqual(read_packets(data)[1][2:], audio)
+
+    def test_split_keeps_packets_and_cuts_at_silence(self):
+        audio = voice(60, quiet_at=(18, 40))
+        data = write_stream(SERIAL, HEAD, TAGS, audio)
+
+        segments = split_on_silence(data, 25)
+        self.assertEqual(len(segments), 3)
+
+        rejoined = []
+        for segment in segments:
+            serial, packets = read_packets(segment)
+            self.assertEqual(serial, SERIAL)
+            self.assertEqual(packets[:2], [HEAD, TAGS])
+            self.assertLessEqual(sum(packet_samples(p) for p in packets[2:]), 25 * SAMPLE_RATE)
+            self.assertLessEqual(duration(segment), 25)
+            rejoined += packets[2:]
+        self.assertEqual(rejoined, audio)
+
+        # Every cut falls inside a pause
+        for segment in segments[:-1]:
+            self.assertEqual(len(read_packets(segment)[1][-1]), 3)
+        for segment in segments[1:]:
+            self.assertEqual(len(read_packets(segment)[1][2]), 3)
+
+    def test_short_or_invalid_audio_unchanged(self):
+        data = write_stream(SERIAL, HEAD, TAGS, voice(5))
+        self.assertEqual(split_on_silence(data, 25), [data])
+        self.assertEqual(split_on_silence(b"not ogg", 25), [b"not ogg"])
+
+if __name__ == "__main__":
+    unittest.main()
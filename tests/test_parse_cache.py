@@ -0,0 +1,46 @@
+"""
+Unit tests for reuse of GPT results by AIParser
+
+Run with: python -m unittest discover tests
+"""
+import asyncio
+import json
+import unittest
+from datetime import date, timedelta
+
+from benchmarks.fakes import FakeOpenAI  # also sets the environment config.py needs
+from ai_parser import ai_parser
+
+def reply(**fields) -> str:
+    trans = {"amount": 15000, "type": "expense", "category": "food", "description": "kofe",
+             "date": None, "currency": "UZS"}
+    trans.update(fields)
+    return json.dumps({"transactions": [trans]})
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        ai_parser.parse_cache.clear()
+
+    def parse_twice(self, text: str, model_reply: str) -> int:
+        """Parse the same text twice; returns how many GPT calls were made"""
+        ai_parser.client = FakeOpenAI(model_reply)
+
+        async def run():
+            await ai_parser.parse_transaction(text, "uz", "UZS")
+            await ai_parser.parse_transaction(text, "uz", "UZS")
+        asyncio.run(run())
+        return ai_parser.client.chat.completions.calls
+
+    def test_undated_result_is_reused(self):
+        self.assertEqual(self.parse_twice("kofe 15000 choy 5000", reply()), 1)
+
+    def test_today_is_reused(self):
+        today = date.today().isoformat()
+        self.assertEqual(self.parse_twice("bugun kofe 15000 choy 5000", reply(date=today)), 1)
+
+    def test_relative_date_is_not_cached(self):
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.parse_twice("kecha kofe 15000", reply(date=yesterday)), 2)
+
+if __name__ == "__main__":
+    unittest.main()
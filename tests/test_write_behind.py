@@ -0,0 +1,89 @@
+"""
+Unit tests for the write-behind transaction journal
+
+Run with: python -m unittest discover tests
+"""
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from postgrest.exceptions import APIError
+from write_behind import WriteBehindBuffer
+
+def read_lines(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+class FakeTable:
+    """write_rows stand-in: stores rows, fails while down, rejects negative amounts"""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    async def write_rows(self, rows):
+        if self.down:
+            raise ConnectionError("database unreachable")
+        if any(row["amount"] < 0 for row in rows):
+            raise APIError({"code": "23514", "message": "amount check failed"})
+        self.rows.extend(rows)
+
+class WriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "transactions.journal")
+        self.table = FakeTable()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def buffer(self) -> WriteBehindBuffer:
+        return WriteBehindBuffer(self.path, self.table.write_rows, interval=60, batch_size=10)
+
+    def add(self, *amounts):
+        async def run():
+            buffer = self.buffer()
+            await buffer.add([{"user_id": 1, "amount": amount} for amount in amounts])
+            return buffer
+        return asyncio.run(run())
+
+    def test_journaled_rows_replayed_on_startup(self):
+        self.table.down = True
+        self.add(100, 200)
+        self.assertEqual(len(read_lines(self.path)), 2)
+
+        # Next process: rows from the journal are sent once the database is back
+        self.table.down = False
+        buffer = self.buffer()
+        self.assertEqual(len(buffer.pending), 2)
+        self.assertTrue(asyncio.run(buffer.flush()))
+        self.assertEqual([row["amount"] for row in self.table.rows], [100, 200])
+        self.assertEqual(read_lines(self.path), [])
+
+    def test_torn_last_line_skipped(self):
+        self.add(100)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"user_id": 1, "amo')  # crash in the middle of a write
+        buffer = self.buffer()
+        self.assertEqual([row["amount"] for row in buffer.pending], [100])
+
+    def test_transient_error_keeps_rows(self):
+        self.table.down = True
+        buffer = self.add(100, 200)
+        self.assertFalse(asyncio.run(buffer.flush()))
+        self.assertEqual(len(buffer.pending), 2)
+        self.assertEqual([row["amount"] for row in read_lines(self.path)], [100, 200])
+        self.assertFalse(os.path.exists(self.path + ".dead"))
+
+    def test_rejected_row_dead_lettered(self):
+        buffer = self.add(100, -5, 200)
+        self.assertTrue(asyncio.run(buffer.flush()))
+        self.assertEqual([row["amount"] for row in self.table.rows], [100, 200])
+        self.assertEqual([row["amount"] for row in read_lines(self.path + ".dead")], [-5])
+        self.assertEqual(read_lines(self.path), [])
+        self.assertEqual(buffer.pending, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,6 @@
+from string import Formatter
+from typing import Dict
+
 TRANSLATIONS = {
     "uz": {
         "welcome": "👋 Assalomu alaykum! Men Calco AI - sizning shaxsiy moliyaviy yordamchingizman.\n\n🌐 Tilni tanlang:",
@@ -15,6 +18,9 @@ TRANSLATIONS = {
         "parse_error": "❌ Tushunmadim. Iltimos, aniqroq yozing.\n\nMasalan: \"10000 non uchun\"",
         "history_empty": "📭 Hali hech narsa yo'q",
         "history_title": "📜 Oxirgi 10 ta operatsiya:",
+        "history_more_title": "📜 Oldingi operatsiyalar:",
+        "history_newer": "⬅️ Yangiroq",
+        "history_older": "Eskiroq ➡️",
         "monthly_report_text": "📊 {month}-oy hisoboti\n\n💰 Daromad: {income} so'm\n💸 Xarajat: {expense} so'm\n📈 Balans: {balance} so'm\n\n📝 Jami operatsiyalar: {count}",
         "loan_menu": "💰 Qarzlar\n\nNima qilmoqchisiz?",
         "add_loan": "➕ Qarz berish",
@@ -26,7 +32,9 @@ TRANSLATIONS = {
         "send_loan_info": "💬 Qarz ma'lumotlarini yozing.\n\nMasalan: \"Aliga 100000 berdim\"",
         "loan_added": "✅ Qarz qo'shildi!\n\n👤 Kim: {person}\n💰 Summa: {amount} so'm\n📅 Sana: {date}",
         "voice_processing": "🎤 Ovozli xabar qayta ishlanmoqda...",
+        "processing": "⏳ Qayta ishlanmoqda...",
         "voice_transcribed": "📝 Matn: {text}",
+        "voice_too_large": "❌ Ovozli xabar juda katta. Iltimos, qisqaroq yuboring.",
         "edit_transaction": "✏️ Tahrirlash",
         "delete_transaction": "🗑 O'chirish",
         "confirm_delete": "❓ Rostdan ham o'chirmoqchimisiz?\n\n💰 {amount} so'm - {category}\n📝 {description}",
@@ -34,6 +42,15 @@ TRANSLATIONS = {
         "no_cancel": "❌ Yo'q, bekor qilish",
         "transaction_deleted": "🗑 Tranzaksiya o'chirildi",
         "transaction_not_found": "❌ Tranzaksiya topilmadi",
+        "request_superseded": "⏭ Bu xabar keyingi xabaringiz bilan almashtirildi",
+        "service_busy": "⏳ Hozir so'rovlar juda ko'p. Iltimos, bir daqiqadan keyin qayta yuboring.",
+        "choose_currency": "💱 Valyutani tanlang:",
+        "currency_set": "✅ Valyuta {currency} ga o'rnatildi!",
+        "settings_text": "⚙️ Sozlamalar\n\n🌐 Joriy til: {language}\n💱 Joriy valyuta: {currency}\n\nNimani o'zgartirmoqchisiz?",
+        "change_language": "🌐 Tilni o'zgartirish",
+        "change_currency": "💱 Valyutani o'zgartirish",
+        "transactions_added": "✅ {count} ta tranzaksiya qo'shildi!",
+        "transactions_total": "💵 Jami: {total} {currency}",
     },
     "en": {
         "welcome": "👋 Hello! I'm Calco AI - your personal finance assistant.\n\n🌐 Choose language:",
@@ -51,6 +68,9 @@ TRANSLATIONS = {
         "parse_error": "❌ Couldn't understand. Please be more specific.\n\nFor example: \"10000 for bread\"",
         "history_empty": "📭 Nothing here yet",
         "history_title": "📜 Last 10 transactions:",
+        "history_more_title": "📜 Earlier transactions:",
+        "history_newer": "⬅️ Newer",
+        "history_older": "Older ➡️",
         "monthly_report_text": "📊 Report for {month} month\n\n💰 Income: {income} sum\n💸 Expense: {expense} sum\n📈 Balance: {balance} sum\n\n📝 Total transactions: {count}",
         "loan_menu": "💰 Loans\n\nWhat would you like to do?",
         "add_loan": "➕ Lend Money",
@@ -62,7 +82,9 @@ TRANSLATIONS = {
         "send_loan_info": "💬 Write loan information.\n\nFor example: \"Lent Ali 100000\"",
         "loan_added": "✅ Loan added!\n\n👤 To: {person}\n💰 Amount: {amount} sum\n📅 Date: {date}",
         "voice_processing": "🎤 Processing voice message...",
+        "processing": "⏳ Processing...",
         "voice_transcribed": "📝 Text: {text}",
+        "voice_too_large": "❌ Voice message is too large. Please send a shorter one.",
         "edit_transaction": "✏️ Edit",
         "delete_transaction": "🗑 Delete",
         "confirm_delete": "❓ Are you sure you want to delete?\n\n💰 {amount} sum - {category}\n📝 {description}",
@@ -70,6 +92,15 @@ TRANSLATIONS = {
         "no_cancel": "❌ No, cancel",
         "transaction_deleted": "🗑 Transaction deleted",
         "transaction_not_found": "❌ Transaction not found",
+        "request_superseded": "⏭ Skipped - replaced by your newer message",
+        "service_busy": "⏳ Too many requests right now. Please send it again in a minute.",
+        "choose_currency": "💱 Choose currency:",
+        "currency_set": "✅ Currency set to {currency}!",
+        "settings_text": "⚙️ Settings\n\n🌐 Current language: {language}\n💱 Current currency: {currency}\n\nWhat would you like to change?",
+        "change_language": "🌐 Change Language",
+        "change_currency": "💱 Change Currency",
+        "transactions_added": "✅ Added {count} transactions!",
+        "transactions_total": "💵 Total: {total} {currency}",
     },
     "ru": {
         "welcome": "👋 Здравствуйте! Я Calco AI - ваш личный финансовый помощник.\n\n🌐 Выберите язык:",
@@ -87,6 +118,9 @@ TRANSLATIONS = {
         "parse_error": "❌ Не понял. Пожалуйста, напишите точнее.\n\nНапример: \"10000 на хлеб\"",
         "history_empty": "📭 Пока ничего нет",
         "history_title": "📜 Последние 10 операций:",
+        "history_more_title": "📜 Более ранние операции:",
+        "history_newer": "⬅️ Новее",
+        "history_older": "Раньше ➡️",
         "monthly_report_text": "📊 Отчет за {month} месяц\n\n💰 Доход: {income} сум\n💸 Расход: {expense} сум\n📈 Баланс: {balance} сум\n\n📝 Всего операций: {count}",
         "loan_menu": "💰 Долги\n\nЧто вы хотите сделать?",
         "add_loan": "➕ Дать в долг",
@@ -98,7 +132,9 @@ TRANSLATIONS = {
         "send_loan_info": "💬 Напишите информацию о долге.\n\nНапример: \"Дал Али 100000\"",
         "loan_added": "✅ Долг добавлен!\n\n👤 Кому: {person}\n💰 Сумма: {amount} сум\n📅 Дата: {date}",
         "voice_processing": "🎤 Обработка голосового сообщения...",
+        "processing": "⏳ Обработка...",
         "voice_transcribed": "📝 Текст: {text}",
+        "voice_too_large": "❌ Голосовое сообщение слишком большое. Отправьте покороче.",
         "edit_transaction": "✏️ Редактировать",
         "delete_transaction": "🗑 Удалить",
         "confirm_delete": "❓ Вы уверены, что хотите удалить?\n\n💰 {amount} сум - {category}\n📝 {description}",
@@ -106,12 +142,56 @@ TRANSLATIONS = {
         "no_cancel": "❌ Нет, отменить",
         "transaction_deleted": "🗑 Транзакция удалена",
         "transaction_not_found": "❌ Транзакция не найдена",
+        "request_superseded": "⏭ Пропущено - заменено вашим новым сообщением",
+        "service_busy": "⏳ Сейчас слишком много запросов. Пожалуйста, отправьте ещё раз через минуту.",
+        "choose_currency": "💱 Выберите валюту:",
+        "currency_set": "✅ Валюта установлена на {currency}!",
+        "settings_text": "⚙️ Настройки\n\n🌐 Текущий язык: {language}\n💱 Текущая валюта: {currency}\n\nЧто хотите изменить?",
+        "change_language": "🌐 Изменить язык",
+        "change_currency": "💱 Изменить валюту",
+        "transactions_added": "✅ Добавлено {count} транзакций!",
+        "transactions_total": "💵 Всего: {total} {currency}",
     }
 }
 
+class Template:
+    """A translation string with its placeholders resolved once at import"""
+    __slots__ = ("text", "fields", "render")
+    
+    def __init__(self, text: str):
+        self.text = text
+        self.fields = frozenset(name for _, name, _, _ in Formatter().parse(text) if name is not None)
+        self.render = text.format
+
+def _compile(translations: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, Template]]:
+    """
+    Build templates for every language and check they agree with the Uzbek ones:
+    same keys and same named placeholders. Raises ValueError at startup otherwise.
+    """
+    reference = translations["uz"]
+    compiled = {}
+    for lang, texts in translations.items():
+        templates = {key: Template(text) for key, text in texts.items()}
+        problems = [f"missing {key!r}" for key in reference if key not in texts]
+        problems += [f"unknown {key!r}" for key in texts if key not in reference]
+        for key, template in templates.items():
+            if any(not name or name.isdigit() for name in template.fields):
+                problems.append(f"{key!r} has positional placeholders")
+            elif key in reference and template.fields != frozenset(
+                    name for _, name, _, _ in Formatter().parse(reference[key]) if name is not None):
+                problems.append(f"{key!r} placeholders differ from uz")
+        if problems:
+            raise ValueError(f"Translations for {lang!r}: {', '.join(problems)}")
+        compiled[lang] = templates
+    return compiled
+
+COMPILED = _compile(TRANSLATIONS)
+
 def t(key: str, lang: str = "uz", **kwargs) -> str:
     """Get translation with optional formatting"""
-    text = TRANSLATIONS.get(lang, TRANSLATIONS["uz"]).get(key, key)
+    template = COMPILED.get(lang, COMPILED["uz"]).get(key)
+    if template is None:
+        return key
     if kwargs:
-        return text.format(**kwargs)
-    return text
+        return template.render(**kwargs)
+    return template.text
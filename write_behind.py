@@ -0,0 +1,165 @@
+"""
+Write-behind buffer for transaction inserts
+Rows are appended to a local journal (one JSON object per line, fsync'd) and
+acknowledged at once, then written to the database in batches. The journal
+always holds exactly the rows not yet confirmed by the database, so rows left
+over from a crash are sent again on startup. Each row carries an
+idempotency_key and batches are sent as upserts that ignore known keys, so a
+batch retried after a lost response is not stored twice. Rows the database
+refuses for good (bad data, constraint violations) are moved to a dead-letter
+file, {path}.dead, so they don't hold back the rows behind them.
+"""
+import asyncio
+import json
+import os
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from postgrest.exceptions import APIError
+
+def is_rejected(error: Exception) -> bool:
+    """Whether the database refused the rows themselves, so sending them again can't help"""
+    # SQLSTATE classes 22 (data exception) and 23 (integrity constraint violation)
+    return isinstance(error, APIError) and str(error.code or "")[:2] in ("22", "23")
+
+class WriteBehindBuffer:
+    def __init__(self, path: str, write_rows: Callable[[List[Dict]], Awaitable[None]],
+                 interval: float, batch_size: int):
+        """
+        Args:
+            path: Journal file
+            write_rows: Coroutine storing a batch of rows (must ignore duplicate keys)
+            interval: Seconds between flushes while rows are pending
+            batch_size: Flush early once this many rows are pending; also the
+                largest batch sent in one request
+        """
+        self.path = path
+        self.dead_path = f"{path}.dead"
+        self.write_rows = write_rows
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending: List[Dict] = self._load()
+        self.journal_lock = asyncio.Lock()
+        self.flush_lock = asyncio.Lock()
+        self.full = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        if self.pending:
+            print(f"📒 {len(self.pending)} journaled rows will be written to the database")
+
+    def _load(self) -> List[Dict]:
+        rows = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        continue  # line torn by a crash mid-write; it was never acknowledged
+        except FileNotFoundError:
+            pass
+        return rows
+
+    def _append(self, rows: List[Dict], path: Optional[str] = None):
+        with open(path or self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, rows: List[Dict]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        """Start the flush loop on the running event loop; journaled rows are sent first"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._flush_loop())
+            if self.pending:
+                self.full.set()
+
+    async def add(self, rows: List[Dict]) -> List[Dict]:
+        """Journal rows and return them with their idempotency keys; they reach the database later"""
+        self.start()
+        rows = [dict(row, idempotency_key=str(uuid.uuid4())) for row in rows]
+        async with self.journal_lock:
+            await asyncio.to_thread(self._append, rows)
+            self.pending.extend(rows)
+        if len(self.pending) >= self.batch_size:
+            self.full.set()
+        return rows
+
+    def has_pending(self, user_id: int) -> bool:
+        return any(row["user_id"] == user_id for row in self.pending)
+
+    async def _write_chunk(self, chunk: List[Dict]) -> Tuple[List[Dict], List[Dict], bool]:
+        """Send a chunk; returns (rows stored, rows rejected, whether nothing failed temporarily)"""
+        try:
+            await self.write_rows(chunk)
+            return chunk, [], True
+        except Exception as e:
+            if not is_rejected(e):
+                print(f"⚠️  Write-behind flush failed, rows kept for retry: {e}")
+                return [], [], False
+            if len(chunk) == 1:
+                print(f"❌ Write-behind row rejected by the database: {e}")
+                return [], chunk, True
+
+        # One bad row fails the whole batch; send the rows one by one to find it
+        stored, rejected = [], []
+        for row in chunk:
+            row_stored, row_rejected, ok = await self._write_chunk([row])
+            stored += row_stored
+            rejected += row_rejected
+            if not ok:
+                return stored, rejected, False
+        return stored, rejected, True
+
+    async def flush(self) -> bool:
+        """Write all pending rows now; returns False if a batch failed and was kept for retry"""
+        async with self.flush_lock:
+            batch = list(self.pending)
+            stored, rejected = [], []
+            ok = True
+            for i in range(0, len(batch), self.batch_size):
+                chunk_stored, chunk_rejected, ok = await self._write_chunk(batch[i:i + self.batch_size])
+                stored += chunk_stored
+                rejected += chunk_rejected
+                if not ok:
+                    print(f"⚠️  {len(batch) - len(stored) - len(rejected)} write-behind rows kept for retry")
+                    break
+
+            if stored or rejected:
+                done = {row["idempotency_key"] for row in stored + rejected}
+                async with self.journal_lock:
+                    try:
+                        if rejected:
+                            await asyncio.to_thread(self._append, rejected, self.dead_path)
+                            print(f"📒 {len(rejected)} rejected rows moved to {self.dead_path}")
+                        self.pending = [row for row in self.pending if row["idempotency_key"] not in done]
+                        await asyncio.to_thread(self._rewrite, self.pending)
+                    except OSError as e:
+                        # Rows still in the journal are sent again later; their keys keep them single
+                        print(f"❌ Write-behind journal error: {e}")
+                        return False
+            return ok
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            if self.pending:
+                await self.flush()
+
+    async def stop(self):
+        """Stop the flush loop and write what is pending (left in the journal if that fails)"""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.pending:
+            await self.flush()
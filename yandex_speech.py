@@ -1,9 +1,19 @@
 """
 Yandex SpeechKit integration for Uzbek speech recognition
 """
-import requests
-import json
+import asyncio
+import random
+import time
+import httpx
 from typing import Optional
+from config import (
+    YANDEX_CONNECT_TIMEOUT, YANDEX_READ_TIMEOUT, YANDEX_MAX_RETRIES, YANDEX_POOL_SIZE
+)
+from metrics import YANDEX_LATENCY
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 8  # seconds
 
 class YandexSpeechKit:
     def __init__(self, api_key: str, folder_id: str):
@@ -17,71 +27,86 @@ class YandexSpeechKit:
         self.api_key = api_key
         self.folder_id = folder_id
         self.api_url = "https://stt.api.cloud.yandex.net/speech/v1/stt:recognize"
+        
+        # One keep-alive pool for every request, so voice messages skip the TCP/TLS handshake
+        self.client = httpx.AsyncClient(
+            headers={'Authorization': f'Api-Key {self.api_key}'},
+            timeout=httpx.Timeout(
+                YANDEX_READ_TIMEOUT,
+                connect=YANDEX_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=YANDEX_POOL_SIZE,
+                max_keepalive_connections=YANDEX_POOL_SIZE
+            )
+        )
     
-    def transcribe_audio(self, audio_file_path: str, language: str = "uz-UZ") -> Optional[str]:
+    async def close(self):
+        await self.client.aclose()
+    
+    async def transcribe_audio(self, audio_data: bytes, language: str = "uz-UZ") -> Optional[str]:
         """
-        Transcribe audio file using Yandex SpeechKit
+        Transcribe audio using Yandex SpeechKit
         
         Args:
-            audio_file_path: Path to audio file (OGG, MP3, WAV)
+            audio_data: OGG Opus audio bytes (Telegram voice message)
             language: Language code (uz-UZ for Uzbek, ru-RU for Russian)
         
         Returns:
             Transcribed text or None if failed
         """
+        params = {
+            'lang': language,
+            'folderId': self.folder_id,
+            'format': 'oggopus',  # Telegram voice messages are OGG Opus
+        }
+        
+        start = time.perf_counter()
         try:
-            # Read audio file
-            with open(audio_file_path, 'rb') as audio_file:
-                audio_data = audio_file.read()
-            
-            # Prepare request
-            headers = {
-                'Authorization': f'Api-Key {self.api_key}',
-            }
-            
-            params = {
-                'lang': language,
-                'folderId': self.folder_id,
-                'format': 'oggopus',  # Telegram voice messages are OGG Opus
-            }
-            
-            # Send request
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                params=params,
-                data=audio_data,
-                timeout=30
-            )
-            
-            # Check response
-            if response.status_code == 200:
-                result = response.json()
-                if 'result' in result:
-                    text = result['result']
-                    print(f"Yandex transcription: {text}")
-                    return text
-                else:
-                    print(f"Yandex response has no result: {result}")
-                    return None
-            else:
-                print(f"Yandex API error: {response.status_code} - {response.text}")
-                return None
-                
+            response = await self._post(params, audio_data)
         except Exception as e:
             print(f"Yandex transcription error: {e}")
             return None
-    
-    def transcribe_with_fallback(self, audio_file_path: str, language: str = "uz-UZ") -> Optional[str]:
-        """
-        Transcribe with automatic fallback to Russian if Uzbek fails
-        """
-        # Try primary language
-        text = self.transcribe_audio(audio_file_path, language)
+        finally:
+            YANDEX_LATENCY.observe(time.perf_counter() - start, language)
+        
+        if response.status_code != 200:
+            print(f"Yandex API error: {response.status_code} - {response.text}")
+            return None
         
-        # If failed and language is Uzbek, try Russian (common code-switching)
-        if not text and language == "uz-UZ":
-            print("Uzbek transcription failed, trying Russian...")
-            text = self.transcribe_audio(audio_file_path, "ru-RU")
+        result = response.json()
+        if 'result' not in result:
+            print(f"Yandex response has no result: {result}")
+            return None
         
+        text = result['result']
+        print(f"Yandex transcription: {text}")
         return text
+    
+    async def _post(self, params: dict, audio_data: bytes) -> httpx.Response:
+        """POST with retries on 429/5xx and connection errors, honoring Retry-After"""
+        for attempt in range(YANDEX_MAX_RETRIES + 1):
+            last_attempt = attempt == YANDEX_MAX_RETRIES
+            try:
+                response = await self.client.post(self.api_url, params=params, content=audio_data)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise
+                print(f"⚠️  Yandex request failed ({e!r}), retrying...")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+            
+            print(f"⚠️  Yandex API returned {response.status_code}, retrying...")
+            await asyncio.sleep(self._backoff(attempt, response.headers.get('Retry-After')))
+    
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_BACKOFF)
+            except ValueError:
+                pass  # HTTP-date form; fall back to exponential backoff
+        return min(0.5 * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1)